@@ -0,0 +1,208 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from models import VisaAccount
+
+# Re-read this far behind the watermark so rows committed late with an older
+# updated_at are not missed; re-applying a row is harmless.
+WATERMARK_OVERLAP = datetime.timedelta(seconds=5)
+
+# Rows are streamed from the database in chunks of this size
+STREAM_CHUNK_SIZE = 1000
+
+# After the LISTEN connection is lost, retry after this long, doubling up to the maximum
+RELISTEN_SECONDS = 5
+MAX_RELISTEN_SECONDS = 300
+
+
+class AccountRecord:
+    """Listener-side snapshot of one VisaAccount row: plain slots, no ORM state, no password."""
+
+    __slots__ = ('id', 'unique_id', 'email', 'first_name', 'last_name',
+                 'target_month_year', 'target_day_start', 'target_day_end', 'telegram_chat_id')
+
+    def __init__(self, id, unique_id, email, first_name, last_name,
+                 target_month_year, target_day_start, target_day_end, telegram_chat_id=None):
+        self.id = id
+        self.unique_id = unique_id
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+        self.target_month_year = target_month_year
+        self.target_day_start = target_day_start
+        self.target_day_end = target_day_end
+        self.telegram_chat_id = telegram_chat_id
+
+    def __repr__(self):
+        return f'<AccountRecord {self.unique_id}>'
+
+
+# Column-only select matching AccountRecord's fields, followed by the feed bookkeeping columns
+RECORD_COLUMNS = (
+    VisaAccount.id, VisaAccount.unique_id, VisaAccount.email,
+    VisaAccount.first_name, VisaAccount.last_name,
+    VisaAccount.target_month_year, VisaAccount.target_day_start, VisaAccount.target_day_end,
+    VisaAccount.telegram_chat_id,
+)
+FEED_COLUMNS = RECORD_COLUMNS + (VisaAccount.updated_at, VisaAccount.deleted_at)
+RECORD_WIDTH = len(RECORD_COLUMNS)
+
+
+class AccountChangeFeed:
+    """
+    In-memory id -> AccountRecord map kept current from rows whose updated_at
+    moved past the last watermark. The first poll (or the first after reset())
+    loads every live row; later polls only touch changed rows.
+
+    Rows are streamed column-only in chunks and copied into records, so the
+    caller can release its session as soon as poll() returns.
+    """
+
+    def __init__(self):
+        self.accounts: Dict[int, AccountRecord] = {}
+        self.watermark: Optional[datetime.datetime] = None
+
+    def reset(self):
+        self.accounts = {}
+        self.watermark = None
+
+    def poll(self, session, *criteria) -> Tuple[List[AccountRecord], List[int]]:
+        """
+        Applies changes since the watermark. `criteria` narrows the rows (e.g. to
+        owned shards). Returns (changed accounts, removed account ids).
+        """
+        query = (
+            select(*FEED_COLUMNS)
+            .where(*criteria)
+            .execution_options(yield_per=STREAM_CHUNK_SIZE)
+        )
+        if self.watermark is None:
+            query = query.where(VisaAccount.deleted_at.is_(None))
+        else:
+            query = query.where(VisaAccount.updated_at > self.watermark - WATERMARK_OVERLAP)
+
+        changed, removed = [], []
+        watermark = self.watermark
+        for row in session.execute(query):
+            updated_at, deleted_at = row[RECORD_WIDTH], row[RECORD_WIDTH + 1]
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+            if deleted_at is not None:
+                if self.accounts.pop(row[0], None) is not None:
+                    removed.append(row[0])
+            else:
+                record = AccountRecord(*row[:RECORD_WIDTH])
+                self.accounts[record.id] = record
+                changed.append(record)
+        self.watermark = watermark
+
+        if self.watermark is None:
+            # Empty table: start from now so the next poll is incremental
+            self.watermark = datetime.datetime.utcnow()
+        return changed, removed
+
+
+class PgChangeListener:
+    """
+    Wakes the listener early when the web app NOTIFYs a channel (Postgres only).
+    Polling on the regular interval still happens, so missed notifications only
+    cost latency. A lost LISTEN connection is dropped and re-established with
+    backoff; in between, the listener just polls.
+    """
+
+    def __init__(self, engine, channel: str):
+        self.engine = engine
+        self.channel = channel
+        self.event = asyncio.Event()
+        # Pooled connection wrapper, kept so the connection is never handed out to anyone else
+        self._raw = None
+        self._connection = None
+        self._relisten_seconds = RELISTEN_SECONDS
+        # Monotonic time of the next reconnect attempt; None while connected or unsupported
+        self._relisten_at: Optional[float] = None
+
+    def _connect(self):
+        raw = self.engine.raw_connection()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+        except Exception:
+            raw.invalidate()
+            raise
+        return raw
+
+    def _attach(self, raw):
+        self._raw, self._connection = raw, raw.driver_connection
+        asyncio.get_running_loop().add_reader(self._connection.fileno(), self._on_readable)
+        self._relisten_seconds = RELISTEN_SECONDS
+        self._relisten_at = None
+
+    def start(self) -> bool:
+        """Starts listening on the running loop. Returns False when unsupported or failing."""
+        if self.engine.dialect.name != 'postgresql':
+            return False
+        try:
+            self._attach(self._connect())
+            return True
+        except Exception as e:
+            logging.error(f"LISTEN on {self.channel} unavailable, falling back to polling: {e}")
+            self._relisten_at = time.monotonic() + self._relisten_seconds
+            return False
+
+    def _on_readable(self):
+        try:
+            self._connection.poll()
+        except Exception as e:
+            # The socket stays readable once the connection is gone: stop watching it
+            logging.error(f"LISTEN connection on {self.channel} lost, polling until it is back: {e}")
+            self._drop()
+            # Wake up to poll at once, in case a notification was lost with the connection
+            self.event.set()
+            return
+        if self._connection.notifies:
+            self._connection.notifies.clear()
+            self.event.set()
+
+    def _drop(self):
+        try:
+            asyncio.get_running_loop().remove_reader(self._connection.fileno())
+        except Exception:
+            pass
+        try:
+            self._raw.invalidate()
+        except Exception:
+            pass
+        self._raw = self._connection = None
+        self._relisten_at = time.monotonic() + self._relisten_seconds
+
+    async def _relisten(self):
+        try:
+            raw = await asyncio.to_thread(self._connect)
+        except Exception as e:
+            self._relisten_seconds = min(2 * self._relisten_seconds, MAX_RELISTEN_SECONDS)
+            self._relisten_at = time.monotonic() + self._relisten_seconds
+            logging.debug(f"LISTEN on {self.channel} still unavailable, retrying in {self._relisten_seconds}s: {e}")
+            return
+        self._attach(raw)
+        logging.info(f"Listening for account changes on channel {self.channel} again")
+        # Changes made while disconnected were not notified
+        self.event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Sleeps until `timeout` elapses or a change notification arrives. Returns True if notified."""
+        if self._relisten_at is not None and time.monotonic() >= self._relisten_at:
+            await self._relisten()
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        notified = self.event.is_set()
+        self.event.clear()
+        return notified
@@ -0,0 +1,137 @@
+import datetime
+from bisect import bisect_right
+from calendar import monthrange
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Lower bound used for windows that accept any slot up to their deadline
+OPEN_START = datetime.date.min.toordinal()
+
+
+def account_window(target_month_year: str, target_day_start: int,
+                   target_day_end: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Returns the (lo, hi) day-ordinal window, inclusive, an account wants slots in.
+
+    Without an end day the account wants anything strictly before its start day.
+    With an end day it wants the days from its start day up to and including the
+    end day (clamped to the length of the month). Raises ValueError on malformed targets.
+    """
+    year, month = map(int, target_month_year.split('-'))
+    start = datetime.date(year, month, target_day_start)
+
+    if target_day_end and target_day_end >= target_day_start:
+        end_day = min(target_day_end, monthrange(year, month)[1])
+        return start.toordinal(), datetime.date(year, month, end_day).toordinal()
+
+    return OPEN_START, start.toordinal() - 1
+
+
+class _Node:
+    __slots__ = ('center', 'by_lo', 'by_hi', 'left', 'right')
+
+    def __init__(self, center: int):
+        self.center = center
+        self.by_lo: List[Tuple[int, int]] = []   # (lo, key) ascending
+        self.by_hi: List[Tuple[int, int]] = []   # (-hi, key) ascending, i.e. hi descending
+        self.left: Optional['_Node'] = None
+        self.right: Optional['_Node'] = None
+
+
+class AccountWindowIndex:
+    """
+    Centered interval tree from slot day-ordinals to the accounts whose target
+    window contains them.
+
+    Windows are added and removed by account id; the tree is rebuilt lazily on
+    the next query after a change. A stabbing query costs O(log n + matches).
+    """
+
+    def __init__(self):
+        self._windows: Dict[int, Tuple[int, int]] = {}
+        self._root: Optional[_Node] = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._windows
+
+    def keys(self) -> List[int]:
+        return list(self._windows)
+
+    def window(self, key: int) -> Optional[Tuple[int, int]]:
+        return self._windows.get(key)
+
+    def add(self, key: int, lo: int, hi: int):
+        if self._windows.get(key) != (lo, hi):
+            self._windows[key] = (lo, hi)
+            self._dirty = True
+
+    def discard(self, key: int):
+        if self._windows.pop(key, None) is not None:
+            self._dirty = True
+
+    def clear(self):
+        self._windows.clear()
+        self._root = None
+        self._dirty = False
+
+    def _build(self, intervals: List[Tuple[int, int, int]]) -> Optional[_Node]:
+        if not intervals:
+            return None
+
+        endpoints = sorted(p for lo, hi, _ in intervals for p in (lo, hi))
+        node = _Node(endpoints[len(endpoints) // 2])
+        left, right = [], []
+
+        for lo, hi, key in intervals:
+            if hi < node.center:
+                left.append((lo, hi, key))
+            elif lo > node.center:
+                right.append((lo, hi, key))
+            else:
+                node.by_lo.append((lo, key))
+                node.by_hi.append((-hi, key))
+
+        node.by_lo.sort()
+        node.by_hi.sort()
+        node.left = self._build(left)
+        node.right = self._build(right)
+        return node
+
+    def _ensure_built(self):
+        if self._dirty:
+            self._root = self._build([(lo, hi, key) for key, (lo, hi) in self._windows.items()])
+            self._dirty = False
+
+    def stab(self, ordinal: int) -> List[int]:
+        """Account ids whose window contains the given day-ordinal."""
+        self._ensure_built()
+        found = []
+        node = self._root
+
+        while node is not None:
+            if ordinal < node.center:
+                # Every interval here ends at or after center; keep those starting early enough
+                for lo, key in node.by_lo[:bisect_right(node.by_lo, (ordinal, float('inf')))]:
+                    found.append(key)
+                node = node.left
+            elif ordinal > node.center:
+                # Every interval here starts at or before center; keep those ending late enough
+                for _, key in node.by_hi[:bisect_right(node.by_hi, (-ordinal, float('inf')))]:
+                    found.append(key)
+                node = node.right
+            else:
+                found.extend(key for _, key in node.by_lo)
+                break
+
+        return found
+
+    def match(self, slots: Iterable[datetime.date]) -> Dict[int, List[datetime.date]]:
+        """Groups the given slots by matching account id, each list in slot order."""
+        matches: Dict[int, List[datetime.date]] = {}
+        for slot in sorted(slots):
+            for key in self.stab(slot.toordinal()):
+                matches.setdefault(key, []).append(slot)
+        return matches
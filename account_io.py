@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import MultiDict
+
+from forms import AddAccountForm
+from models import VisaAccount
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+# Fields accepted on import, in AddAccountForm order
+IMPORT_FIELDS = (
+    'email', 'password', 'unique_id', 'first_name', 'last_name', 'appointment_type',
+    'target_month_year', 'target_day_start', 'target_day_end', 'telegram_chat_id',
+)
+
+# Exported columns; the plaintext password is never exported
+EXPORT_COLUMNS = (
+    VisaAccount.unique_id, VisaAccount.email, VisaAccount.first_name, VisaAccount.last_name,
+    VisaAccount.appointment_type, VisaAccount.target_month_year,
+    VisaAccount.target_day_start, VisaAccount.target_day_end, VisaAccount.telegram_chat_id,
+    VisaAccount.last_checked,
+)
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+
+_INSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+
+def parse_rows(body: bytes, content_type: str) -> List[Dict]:
+    """
+    Decodes an import body: a JSON array (or {"accounts": [...]}), JSON Lines
+    (application/x-ndjson, application/jsonl) or CSV with a header row.
+    Raises ValueError on a body that cannot be decoded at all.
+    """
+    text = body.decode('utf-8-sig')
+    content_type = (content_type or '').split(';')[0].strip().lower()
+
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if content_type in ('text/csv', 'application/csv'):
+        try:
+            return list(csv.DictReader(io.StringIO(text)))
+        except csv.Error as e:
+            # e.g. a field longer than csv.field_size_limit()
+            raise ValueError(f'Malformed CSV: {e}') from e
+
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get('accounts')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of accounts or {"accounts": [...]}')
+    return data
+
+
+def validate_rows(rows: Iterable) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Runs every row through AddAccountForm's own validators (one reused form
+    instance, CSRF off). Returns (clean rows, per-row error reports). Within
+    one import the last row for a Unique ID wins.
+    """
+    form = AddAccountForm(formdata=None, meta={'csrf': False})
+    clean: Dict[str, Dict] = {}
+    errors = []
+
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'row': ['Expected an object.']}})
+            continue
+
+        form.process(MultiDict({
+            field: str(row[field]) for field in IMPORT_FIELDS if row.get(field) not in (None, '')
+        }))
+        if not form.validate():
+            errors.append({'row': number, 'unique_id': row.get('unique_id'), 'errors': form.errors})
+            continue
+
+        clean[form.unique_id.data] = {
+            'email': form.email.data,
+            'password': form.password.data,
+            'unique_id': form.unique_id.data,
+            'first_name': form.first_name.data,
+            'last_name': form.last_name.data,
+            'appointment_type': form.appointment_type.data,
+            'target_month_year': form.target_month_year.data,
+            'target_day_start': form.target_day_start.data,
+            'target_day_end': form.target_day_end.data or None,
+            'telegram_chat_id': form.telegram_chat_id.data,
+        }
+
+    return list(clean.values()), errors
+
+
+def upsert_accounts(session, rows: List[Dict]) -> int:
+    """
+    Inserts or updates (on unique_id) the given rows in batches, reviving
+    soft-deleted accounts. The caller commits. Returns the number of rows written.
+    """
+    dialect = session.get_bind().dialect.name
+    insert = _INSERTS.get(dialect)
+    if insert is None:
+        raise RuntimeError(f'Bulk upsert is not supported on {dialect}')
+
+    statement = insert(VisaAccount.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['unique_id'],
+        set_={field: statement.excluded[field]
+              for field in IMPORT_FIELDS + ('updated_at', 'deleted_at') if field != 'unique_id'},
+    )
+
+    # One compiled statement executed per batch as executemany (batched into
+    # multi-row VALUES by SQLAlchemy where the driver supports it)
+    connection = session.connection()
+    now = datetime.utcnow()
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = [dict(row, last_checked=now, updated_at=now, deleted_at=None)
+                 for row in rows[start:start + IMPORT_BATCH_SIZE]]
+        connection.execute(statement, batch)
+    return len(rows)
+
+
+def _export_rows(session) -> Iterator:
+    query = (
+        select(*EXPORT_COLUMNS)
+        .where(VisaAccount.deleted_at.is_(None))
+        .order_by(VisaAccount.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for row in session.execute(query):
+        record = row._asdict()
+        record['last_checked'] = record['last_checked'].isoformat() if record['last_checked'] else None
+        yield record
+
+
+def export_jsonl(session) -> Iterator[str]:
+    for record in _export_rows(session):
+        yield json.dumps(record) + '\n'
+
+
+def export_json(session) -> Iterator[str]:
+    yield '['
+    separator = ''
+    for record in _export_rows(session):
+        yield separator + json.dumps(record)
+        separator = ','
+    yield ']\n'
+
+
+def export_csv(session) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for count, record in enumerate(_export_rows(session), start=1):
+        writer.writerow(record)
+        # Hand the buffer off in chunks rather than per row
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+EXPORTERS = {
+    'jsonl': (export_jsonl, 'application/x-ndjson'),
+    'json': (export_json, 'application/json'),
+    'csv': (export_csv, 'text/csv'),
+}
@@ -1,9 +1,20 @@
+import hmac
 import os
-from flask import Flask, render_template, redirect, url_for, flash
+from flask import Flask, render_template, redirect, url_for, flash, request, session, make_response, jsonify, Response, stream_with_context, g
+from werkzeug.http import is_resource_modified
 from dotenv import load_dotenv
 from datetime import datetime
-from models import db, VisaAccount 
-from forms import LoginForm, AddAccountForm
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, select, text
+from models import Base, VisaAccount, notify_account_change
+from forms import LoginForm, AddAccountForm, MONTH_CHOICES
+import dashboard_query
+from dashboard_feed import DashboardHub, parse_ids
+import account_io
+import slot_history
+from database import engine_options, instrument_engine
+from metrics import CONTENT_TYPE, REGISTRY
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +27,11 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your_default_secret_key')
 # CRITICAL: This config must be set before db.init_app(app)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False 
+# One pooled connection per request thread of this worker (WEB_THREADS, see gunicorn.conf.py)
+# plus one for the live dashboard poller; pool settings depend on the backend
+WEB_THREADS = int(os.getenv('WEB_THREADS', '4'))
+if app.config['SQLALCHEMY_DATABASE_URI']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], WEB_THREADS + 1)
 
 # If using SQLite locally, ensure instance folder exists (optional for Render)
 if app.config['SQLALCHEMY_DATABASE_URI'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
@@ -24,8 +40,15 @@ if app.config['SQLALCHEMY_DATABASE_URI'] and app.config['SQLALCHEMY_DATABASE_URI
 
 
 # --- 2. CRITICAL FIX: Database Initialization ---
+# Flask-SQLAlchemy session and engine over the plain models in models.py
+db = SQLAlchemy(model_class=Base)
 # The db instance must be registered with the app object immediately
 db.init_app(app)
+with app.app_context():
+    instrument_engine(db.engine)
+    # Change poller shared by every live dashboard of this process; at most half of the
+    # request threads hold a stream open, the other dashboards reconnect every poll
+    dashboard_hub = DashboardHub(db.engine, max_streams=int(os.getenv('DASHBOARD_MAX_STREAMS', WEB_THREADS // 2)))
 # --- END CRITICAL FIX ---
 
 
@@ -37,10 +60,60 @@ def init_db():
     with app.app_context():
         # This is safe to run multiple times; it will only create tables if they don't exist
         db.create_all()
+        upgrade_schema()
     print("Database tables created successfully!")
+
+
+def upgrade_schema():
+    """
+    Adds columns and indexes introduced after a table was first created, since
+    create_all() never alters existing tables. Added columns start out nullable.
+    """
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+                    print(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        # Rows created before the change feed existed count as changed now
+        conn.execute(text('UPDATE visa_account SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL'))
 # --- END CLI Command ---
 
 
+# --- METRICS ---
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests handled.', ['endpoint', 'method', 'status'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram('http_request_seconds', 'Time to build a response.', ['endpoint'])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by endpoint name, not path, so the label set stays bounded
+    endpoint = request.endpoint or 'unmatched'
+    HTTP_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    # Metrics of this worker process only
+    return Response(REGISTRY.expose(), content_type=CONTENT_TYPE)
+# --- END METRICS ---
+
+
 # --- ROUTES ---
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -57,29 +130,71 @@ def logout():
 @app.route('/')
 @app.route('/dashboard')
 def dashboard():
-    # Query to display all accounts on the dashboard
-    accounts = VisaAccount.query.all()
-    return render_template('dashboard.html', accounts=accounts)
+    # One page of accounts (keyset pagination), loading only the displayed columns
+    params = dashboard_query.parse_args(request.args)
+
+    # Conditional GET: unchanged pages are answered with 304 before querying rows.
+    # Skipped while flash messages are pending so they are not swallowed.
+    version, last_modified = dashboard_query.table_version(db.session)
+    etag = dashboard_query.page_etag(version, request.query_string)
+    if '_flashes' not in session and not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    ):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+
+    accounts, next_cursor = dashboard_query.fetch_page(db.session, params)
+    response = make_response(render_template(
+        'dashboard.html',
+        accounts=accounts,
+        params=params,
+        next_cursor=next_cursor,
+        month_choices=MONTH_CHOICES,
+        sort_columns=dashboard_query.SORT_COLUMNS,
+    ))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/dashboard/events')
+def dashboard_events():
+    # Server-Sent Events: diffs for the accounts on the page (?ids=...), alert previews and cycle summaries,
+    # resumed from Last-Event-ID. Served from the shared poller; see DashboardHub for how long a stream is held.
+    return Response(
+        dashboard_hub.stream(parse_ids(request.args.get('ids', '')), request.headers.get('Last-Event-ID', '')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/add', methods=['GET', 'POST'])
 def add_account():
     form = AddAccountForm()
     if form.validate_on_submit():
         try:
+            now = datetime.utcnow()
+            # A soft-deleted account with the same Unique ID is revived instead of duplicated
+            new_account = db.session.scalars(select(VisaAccount).where(
+                VisaAccount.unique_id == form.unique_id.data,
+                VisaAccount.deleted_at.is_not(None)
+            )).first() or VisaAccount()
+
             # Password field is saved as PLAIN TEXT
-            new_account = VisaAccount(
-                email=form.email.data,
-                password=form.password.data,
-                unique_id=form.unique_id.data,
-                first_name=form.first_name.data,
-                last_name=form.last_name.data,
-                appointment_type=form.appointment_type.data,
-                target_month_year=form.target_month_year.data,
-                target_day_start=form.target_day_start.data,
-                target_day_end=form.target_day_end.data if form.target_day_end.data else None,
-                last_checked=datetime.utcnow()
-            )
+            new_account.email = form.email.data
+            new_account.password = form.password.data
+            new_account.unique_id = form.unique_id.data
+            new_account.first_name = form.first_name.data
+            new_account.last_name = form.last_name.data
+            new_account.appointment_type = form.appointment_type.data
+            new_account.target_month_year = form.target_month_year.data
+            new_account.target_day_start = form.target_day_start.data
+            new_account.target_day_end = form.target_day_end.data if form.target_day_end.data else None
+            new_account.telegram_chat_id = form.telegram_chat_id.data
+            new_account.last_checked = now
+            new_account.updated_at = now
+            new_account.deleted_at = None
+
             db.session.add(new_account)
+            notify_account_change(db.session)
             db.session.commit()
             flash(f'Account {new_account.unique_id} added successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -95,8 +210,10 @@ def add_account():
 @app.route('/delete/<int:account_id>')
 def delete_account(account_id):
     account = db.session.get(VisaAccount, account_id)
-    if account:
-        db.session.delete(account)
+    if account and account.deleted_at is None:
+        # Soft delete so the listener's change feed sees the removal
+        account.deleted_at = account.updated_at = datetime.utcnow()
+        notify_account_change(db.session)
         db.session.commit()
         flash(f'Account {account.unique_id} deleted.', 'warning')
     else:
@@ -104,6 +221,73 @@ def delete_account(account_id):
     return redirect(url_for('dashboard'))
 
 
+# --- BULK ACCOUNT API ---
+# The site is public, but these endpoints export every account's email and can overwrite any
+# account, so they need ACCOUNTS_API_TOKEN as a bearer token and are disabled while it is unset
+ACCOUNTS_API_TOKEN = os.getenv('ACCOUNTS_API_TOKEN')
+ACCOUNTS_API_ENDPOINTS = {'import_accounts', 'export_accounts'}
+
+
+@app.before_request
+def require_accounts_api_token():
+    if request.endpoint not in ACCOUNTS_API_ENDPOINTS:
+        return None
+    if not ACCOUNTS_API_TOKEN:
+        return jsonify({'error': 'The account API is disabled. Set ACCOUNTS_API_TOKEN to enable it.'}), 403
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), ACCOUNTS_API_TOKEN.encode()):
+        return jsonify({'error': 'Missing or invalid API token.'}), 401, {'WWW-Authenticate': 'Bearer'}
+    return None
+
+
+@app.route('/api/accounts/import', methods=['POST'])
+def import_accounts():
+    # JSON array, JSON Lines or CSV; rows are validated with AddAccountForm's rules
+    try:
+        rows = account_io.parse_rows(request.get_data(), request.content_type)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'Could not parse request body: {e}'}), 400
+
+    clean_rows, errors = account_io.validate_rows(rows)
+    try:
+        written = account_io.upsert_accounts(db.session, clean_rows)
+        if written:
+            notify_account_change(db.session)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'An unexpected database error occurred: {e}'}), 500
+
+    status = 200 if not errors else 207
+    return jsonify({'received': len(rows), 'imported': written, 'rejected': len(errors), 'errors': errors}), status
+
+@app.route('/api/accounts/export')
+def export_accounts():
+    # Streamed row by row from a chunked query; the password column is never exported
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in account_io.EXPORTERS:
+        return jsonify({'error': f"Unknown format '{export_format}'. Use one of: {', '.join(account_io.EXPORTERS)}"}), 400
+
+    exporter, mimetype = account_io.EXPORTERS[export_format]
+    return Response(
+        stream_with_context(exporter(db.session)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=accounts.{export_format}'}
+    )
+
+
+# --- AVAILABILITY HISTORY API ---
+
+@app.route('/api/history')
+def availability_history():
+    # When each slot date was open over a time range, replayed from the listener's change log
+    try:
+        params = slot_history.parse_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify(slot_history.availability(db.session, **params))
+
+
 if __name__ == '__main__':
     # Initialize DB connection and create tables for LOCAL development only
     with app.app_context():
@@ -0,0 +1,128 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Answers sendMessage (and getMe) like Telegram does, records every call, and
+can answer every Nth call with a 429 flood-control error carrying
+retry_after. Point a bot at it with base_url=server.base_url.
+
+    python benchmarks/fake_telegram.py --port 8081 --rate-limit-every 20
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+
+class FakeTelegramServer:
+    """Threaded HTTP server in the background; start() returns once it is listening."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0.0,
+                 rate_limit_every: int = 0, retry_after: int = 1):
+        self.latency = latency_ms / 1000
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+
+        self.calls: List[Dict] = []
+        self.sent = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self) -> 'FakeTelegramServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.calls = []
+            self.sent = 0
+            self.rate_limited = 0
+
+    def _respond(self, method: str, params: Dict) -> Dict:
+        with self._lock:
+            self.calls.append({'method': method, 'params': params, 'at': time.monotonic()})
+            number = len(self.calls)
+            if method == 'sendMessage' and self.rate_limit_every and number % self.rate_limit_every == 0:
+                self.rate_limited += 1
+                return {'ok': False, 'error_code': 429,
+                        'description': f'Too Many Requests: retry after {self.retry_after}',
+                        'parameters': {'retry_after': self.retry_after}}
+            if method == 'sendMessage':
+                self.sent += 1
+
+        if method == 'getMe':
+            return {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench',
+                                           'username': 'bench_bot'}}
+        if method == 'sendMessage':
+            return {'ok': True, 'result': {
+                'message_id': number, 'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', ''),
+            }}
+        return {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or '{}')
+                else:
+                    params = dict(parse_qsl(body))
+                if server.latency:
+                    time.sleep(server.latency)
+
+                reply = server._respond(self.path.rsplit('/', 1)[-1], params)
+                payload = json.dumps(reply).encode()
+                self.send_response(200 if reply['ok'] else reply['error_code'])
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API server.')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every Nth sendMessage with 429.')
+    parser.add_argument('--retry-after', type=int, default=1, help='Seconds; PTB treats 0 as no flood control.')
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(port=args.port, latency_ms=args.latency_ms,
+                                rate_limit_every=args.rate_limit_every, retry_after=args.retry_after).start()
+    print(f"Fake Telegram API on {server.base_url}<token>/ (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{server.sent} sent, {server.rate_limited} rate-limited")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+HTTP load test of the web tier: dashboard page views and account adds.
+
+Seeds synthetic accounts, starts gunicorn with gunicorn.conf.py on a free
+port (or targets a running server with --url), drives it from concurrent
+keep-alive clients for a fixed time, and reports requests per second and
+p50/p99 latency per route. Runs against SQLite or a local Postgres:
+
+    python benchmarks/load.py --accounts 10000 --workers 4 --threads 4 --concurrency 32
+    python benchmarks/load.py --workers 4 --threads 1          # sync workers, for comparison
+    BENCH_DATABASE_URL=postgresql://localhost/visa_bench python benchmarks/load.py --add-share 0.2
+    python benchmarks/load.py --url http://127.0.0.1:8000 --json result.json
+
+The clients run on threads of this process; at very high request rates the
+client side can become the limit, so watch its CPU as well.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/visa_load.db'
+STARTUP_SECONDS = 30
+
+# Dashboard views a client cycles through (month filters are added from the add form's choices)
+DASHBOARD_PATHS = (
+    '/dashboard',
+    '/dashboard?sort=last_checked&order=desc',
+    '/dashboard?type=reschedule',
+    '/dashboard?sort=target_month_year&per_page=200',
+)
+# Status that counts as success per route (adds redirect back to the dashboard)
+EXPECTED_STATUS = {'dashboard': 200, 'add': 302}
+
+_CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+_MONTH_SELECT = re.compile(r'<select[^>]*name="target_month_year"[^>]*>(.*?)</select>', re.S)
+_OPTION = re.compile(r'<option[^>]*value="([^"]+)"')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(ordered: List[float], share: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def start_server(database_url: str, workers: int, threads: int, log_path: str) -> Tuple[subprocess.Popen, str]:
+    """Starts gunicorn with the production config and waits until it answers."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, PORT=str(port),
+               WEB_CONCURRENCY=str(workers), WEB_THREADS=str(threads))
+    log = open(log_path, 'ab')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=log, stderr=log,
+    )
+    log.close()
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {server.returncode}; see {log_path}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/metrics')
+            if connection.getresponse().status == 200:
+                return server, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn did not answer within {STARTUP_SECONDS}s; see {log_path}')
+
+
+class Client(threading.Thread):
+    """One simulated user on its own keep-alive connection."""
+
+    def __init__(self, number: int, base_url: str, add_share: float, seed: int, run_id: str,
+                 measure_from: float, stop_at: float):
+        super().__init__(name=f'client-{number}', daemon=True)
+        self.number = number
+        address = urlsplit(base_url)
+        self.host, self.port = address.hostname, address.port or 80
+        self.add_share = add_share
+        self.rng = random.Random(seed * 1000 + number)
+        self.run_id = run_id
+        self.measure_from = measure_from
+        self.stop_at = stop_at
+        self.connection: Optional[http.client.HTTPConnection] = None
+        # route -> latencies (seconds) of successful measured requests
+        self.latencies: Dict[str, List[float]] = {'dashboard': [], 'add': []}
+        self.errors: Dict[str, int] = {'dashboard': 0, 'add': 0}
+        self.adds = 0
+        self.form: Optional[Tuple[str, str, List[str]]] = None
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 headers: Optional[Dict[str, str]] = None) -> http.client.HTTPResponse:
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            self.connection.request(method, path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            response.read()
+            return response
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def _load_form(self):
+        """CSRF token, session cookie and month choices from the add form."""
+        self.connection = self.connection or http.client.HTTPConnection(self.host, self.port, timeout=60)
+        self.connection.request('GET', '/add')
+        response = self.connection.getresponse()
+        page = response.read().decode()
+        token = _CSRF.search(page)
+        select = _MONTH_SELECT.search(page)
+        if response.status != 200 or not token or not select:
+            raise RuntimeError(f'unexpected /add page (status {response.status})')
+        # Only the session cookie is kept: later responses would just add flash messages to it
+        cookie = response.getheader('Set-Cookie', '').split(';', 1)[0]
+        self.form = (token.group(1), cookie, _OPTION.findall(select.group(1)))
+
+    def _add(self) -> http.client.HTTPResponse:
+        token, cookie, months = self.form
+        self.adds += 1
+        unique_id = f'LOAD-{self.run_id}-{self.number}-{self.adds}'
+        body = urlencode({
+            'csrf_token': token,
+            'email': f'{unique_id.lower()}@example.com',
+            'password': 'load',
+            'unique_id': unique_id,
+            'first_name': 'Load',
+            'last_name': str(self.adds),
+            'appointment_type': self.rng.choice(('new', 'reschedule')),
+            'target_month_year': self.rng.choice(months),
+            'target_day_start': self.rng.randint(1, 28),
+            'submit': 'Add Account',
+        }).encode()
+        return self._request('POST', '/add', body, {
+            'Content-Type': 'application/x-www-form-urlencoded', 'Cookie': cookie,
+        })
+
+    def run(self):
+        try:
+            self._load_form()
+        except Exception as e:
+            print(f'{self.name}: could not load the add form: {e}', file=sys.stderr)
+            return
+        paths = list(DASHBOARD_PATHS) + [f'/dashboard?month={month}' for month in self.form[2][:3]]
+        while True:
+            started = time.perf_counter()
+            if started >= self.stop_at:
+                break
+            route = 'add' if self.rng.random() < self.add_share else 'dashboard'
+            try:
+                if route == 'add':
+                    status = self._add().status
+                else:
+                    status = self._request('GET', self.rng.choice(paths)).status
+                ok = status == EXPECTED_STATUS[route]
+            except (OSError, http.client.HTTPException):
+                ok = False
+            finished = time.perf_counter()
+            if started < self.measure_from:
+                continue
+            if ok:
+                self.latencies[route].append(finished - started)
+            else:
+                self.errors[route] += 1
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_load(base_url: str, concurrency: int, duration: float, warmup: float, add_share: float,
+             seed: int) -> Dict:
+    run_id = uuid.uuid4().hex[:8]
+    now = time.perf_counter()
+    measure_from, stop_at = now + warmup, now + warmup + duration
+    clients = [Client(number, base_url, add_share, seed, run_id, measure_from, stop_at)
+               for number in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    report = {}
+    total = 0
+    for route in ('dashboard', 'add'):
+        latencies = sorted(value for client in clients for value in client.latencies[route])
+        errors = sum(client.errors[route] for client in clients)
+        total += len(latencies)
+        report[route] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_second': len(latencies) / duration,
+            'p50_ms': _percentile(latencies, 0.50) * 1000,
+            'p99_ms': _percentile(latencies, 0.99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        }
+    report['total'] = {'requests': total, 'requests_per_second': total / duration}
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Web tier load test (dashboard and /add).')
+    parser.add_argument('--url', help='Load an already running server instead of starting gunicorn.')
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--accounts', type=int, default=10000, help='Synthetic accounts to seed.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help='Keep the existing database instead of reseeding.')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers (WEB_CONCURRENCY).')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per worker (WEB_THREADS); 1 = sync.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Simulated users.')
+    parser.add_argument('--duration', type=float, default=15.0, help='Measured seconds.')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Unmeasured seconds first.')
+    parser.add_argument('--add-share', type=float, default=0.1, help='Share of requests that add an account.')
+    parser.add_argument('--server-log', default='/tmp/visa_load_gunicorn.log')
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        # Must be set before anything opens the engine
+        os.environ['DATABASE_URL'] = args.database_url
+        if not args.reuse:
+            from seed import seed_accounts
+            seed_accounts(args.accounts, args.seed, reset=True)
+        server, base_url = start_server(args.database_url, args.workers, args.threads, args.server_log)
+
+    try:
+        report = {'arguments': vars(args)}
+        report.update(run_load(base_url, args.concurrency, args.duration, args.warmup, args.add_share, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print(f"{'route':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route in ('dashboard', 'add'):
+        row = report[route]
+        print(f"{route:<12}{row['requests']:>10}{row['errors']:>8}{row['requests_per_second']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    print(f"{'total':<12}{report['total']['requests']:>10}{'':>8}{report['total']['requests_per_second']:>10.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+End-to-end benchmark of the listener and the notification sender.
+
+Seeds synthetic accounts, runs listener cycles with every delay zeroed
+(every account is due every cycle), then drains the outbox through the
+real sender and dispatcher into a local fake Telegram API. Runs offline;
+with the same arguments the work done is identical from run to run.
+
+    python benchmarks/run.py --accounts 10000 --cycles 5 --messages 2000
+    python benchmarks/run.py --accounts 100000 --churn 100 --rate-limit-every 50 --json result.json
+
+Reported: cold (first) and steady cycle wall time, accounts checked per
+second, database queries per cycle, messages queued, sender throughput, 429s seen, and the
+process's peak RSS after each phase.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/visa_bench.db'
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _bench_source():
+    """Monday/Wednesday slots for the next year, relative to today like the seeded targets."""
+    from slot_sources import MONDAY, WEDNESDAY, AvailabilityRules, RuleSlotSource, iter_months
+
+    today = datetime.date.today()
+    end = today + datetime.timedelta(days=365)
+    rules = AvailabilityRules(
+        start=today, end=end, weekdays=(MONDAY, WEDNESDAY),
+        exclusions={key: {} for key in iter_months(today, end)},
+    )
+    return RuleSlotSource('Benchmark Consulate', rules)
+
+
+def _churn(count: int, rng: random.Random):
+    """Moves `count` random accounts' target day, as edits from the web app would."""
+    from sqlalchemy import func, select, update
+
+    from database import session_scope
+    from models import VisaAccount
+
+    with session_scope() as session:
+        top = session.scalar(select(func.max(VisaAccount.id))) or 0
+        ids = [rng.randint(1, top) for _ in range(count)]
+        session.execute(
+            update(VisaAccount)
+            .where(VisaAccount.id.in_(ids))
+            .values(target_day_start=rng.randint(1, 28), updated_at=datetime.datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+
+async def bench_listener(cycles: int, churn: int, seed: int, digest: bool = False) -> dict:
+    from database import QUERIES
+    from visa_listener import NOTIFICATIONS_QUEUED, VisaSlotListener
+
+    listener = VisaSlotListener(telegram_chat_id=1, poll_interval_seconds=0, sources=[_bench_source()],
+                                digest=digest)
+    listener.min_tick = 0
+    listener.last_checked_flush_seconds = 0
+    await listener.start()
+
+    rng = random.Random(seed)
+    results = []
+    for number in range(cycles + 1):
+        if number and churn:
+            _churn(churn, rng)
+        queries = QUERIES.value
+        started = time.perf_counter()
+        await listener.run_cycle()
+        results.append({
+            'seconds': time.perf_counter() - started,
+            'queries': QUERIES.value - queries,
+            'accounts': len(listener.account_feed.accounts),
+        })
+
+    steady = results[1:] or results
+    steady_seconds = [result['seconds'] for result in steady]
+    return {
+        'accounts': results[0]['accounts'],
+        'cold_cycle_seconds': results[0]['seconds'],
+        'cold_cycle_queries': results[0]['queries'],
+        'steady_cycle_seconds_median': statistics.median(steady_seconds),
+        'steady_cycle_seconds_max': max(steady_seconds),
+        'steady_queries_per_cycle': statistics.mean(result['queries'] for result in steady),
+        'accounts_checked_per_second': results[0]['accounts'] / statistics.median(steady_seconds),
+        'messages_queued': NOTIFICATIONS_QUEUED.value,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+async def bench_sender(messages: int, latency_ms: float, rate_limit_every: int, retry_after: int,
+                       batch_size: int, concurrency: int) -> dict:
+    import telegram
+    from telegram.request import HTTPXRequest
+
+    from fake_telegram import FakeTelegramServer
+    from notification_sender import NotificationSender
+    from telegram_dispatcher import TelegramDispatcher
+
+    server = FakeTelegramServer(latency_ms=latency_ms, rate_limit_every=rate_limit_every,
+                                retry_after=retry_after).start()
+    try:
+        bot = telegram.Bot('0:bench', base_url=server.base_url,
+                           request=HTTPXRequest(connection_pool_size=concurrency))
+        # Zeroed delays: rate limits far above anything reachable, no backoff
+        dispatcher = TelegramDispatcher(bot, max_concurrency=concurrency, global_rate=1e9, chat_rate=1e9,
+                                        group_rate=1e9, backoff_seconds=0)
+        sender = NotificationSender(dispatcher, batch_size=batch_size)
+
+        started = time.perf_counter()
+        claimed = 0
+        while claimed < messages:
+            count = await sender.drain_once()
+            if not count:
+                break
+            claimed += count
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+
+    return {
+        'messages_claimed': claimed,
+        'messages_sent': dispatcher.sent,
+        'messages_dropped': dispatcher.dropped,
+        'rate_limited_responses': server.rate_limited,
+        'seconds': elapsed,
+        'messages_per_second': dispatcher.sent / elapsed if elapsed else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Listener and sender benchmark.')
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL))
+    parser.add_argument('--accounts', type=int, default=10000, help='Synthetic accounts to seed (1k-1M).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help='Keep the existing database instead of reseeding.')
+    parser.add_argument('--cycles', type=int, default=5, help='Steady cycles after the cold one.')
+    parser.add_argument('--churn', type=int, default=0, help='Accounts edited before each steady cycle.')
+    parser.add_argument('--digest', action='store_true', help='Run the listener in digest mode.')
+    parser.add_argument('--messages', type=int, default=2000, help='Outbox rows to deliver (0 skips the sender).')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--telegram-latency-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every Nth send with 429.')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--json', help='Also write the report to this file.')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+
+    # Must be set before anything opens the engine
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from logging_config import setup_logging
+    from seed import seed_accounts
+
+    setup_logging(level=args.log_level)
+
+    report = {'arguments': vars(args)}
+    if not args.reuse:
+        started = time.perf_counter()
+        seed_accounts(args.accounts, args.seed, reset=True)
+        report['seed_seconds'] = time.perf_counter() - started
+
+    report['listener'] = asyncio.run(bench_listener(args.cycles, args.churn, args.seed, args.digest))
+    if args.messages:
+        report['sender'] = asyncio.run(bench_sender(
+            args.messages, args.telegram_latency_ms, args.rate_limit_every, args.retry_after,
+            args.batch_size, args.concurrency,
+        ))
+
+    for section in ('listener', 'sender'):
+        if section in report:
+            print(f"[{section}]")
+            for key, value in report[section].items():
+                print(f"  {key:<32}{value:>14.4f}" if isinstance(value, float) else f"  {key:<32}{value:>14}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Fills visa_account with deterministic synthetic accounts.
+
+Targets are spread over the twelve months after today, so the share of
+urgent, distant and matching accounts stays the same from day to day.
+
+    DATABASE_URL=sqlite:////tmp/visa_bench.db python benchmarks/seed.py --accounts 100000 --reset
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from database import get_engine, session_scope  # noqa: E402
+from models import Base, VisaAccount  # noqa: E402
+
+SEED_BATCH_SIZE = 5000
+APPOINTMENT_TYPES = ('new', 'reschedule')
+
+
+def _month_after(today: datetime.date, months: int) -> str:
+    index = today.year * 12 + today.month - 1 + months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def synthetic_rows(count: int, seed: int = 42, today: datetime.date = None):
+    """Yields `count` account rows; the same seed always yields the same rows."""
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    checked = datetime.datetime(2000, 1, 1)
+    for number in range(count):
+        start = rng.randint(1, 28)
+        yield {
+            'email': f'bench{number}@example.com',
+            'password': 'bench',
+            'unique_id': f'BENCH{number:07d}',
+            'first_name': 'Bench',
+            'last_name': str(number),
+            'appointment_type': APPOINTMENT_TYPES[number % 2],
+            'target_month_year': _month_after(today, rng.randint(1, 12)),
+            'target_day_start': start,
+            'target_day_end': start + rng.randint(0, 10) if rng.random() < 0.5 else None,
+            'last_checked': checked,
+            'updated_at': checked,
+        }
+
+
+def seed_accounts(count: int, seed: int = 42, reset: bool = False) -> int:
+    """Creates the tables, optionally empties visa_account, and inserts `count` rows."""
+    engine = get_engine()
+    if reset:
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    # Core executemany on the session's connection, bypassing ORM bookkeeping
+    statement = insert(VisaAccount.__table__)
+    with session_scope() as session:
+        connection = session.connection()
+        batch = []
+        for row in synthetic_rows(count, seed):
+            batch.append(row)
+            if len(batch) == SEED_BATCH_SIZE:
+                connection.execute(statement, batch)
+                batch = []
+        if batch:
+            connection.execute(statement, batch)
+        session.commit()
+        return session.scalar(select(func.count()).select_from(VisaAccount))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed synthetic VisaAccount rows.')
+    parser.add_argument('--accounts', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='Drop and recreate all tables first.')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    total = seed_accounts(args.accounts, args.seed, args.reset)
+    print(f"Inserted {args.accounts} account(s) in {time.perf_counter() - started:.1f}s; {total} in table.")
+
+
+if __name__ == '__main__':
+    main()
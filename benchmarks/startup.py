@@ -0,0 +1,81 @@
+"""
+Import-time and memory budget for the background workers.
+
+Each entry point is imported in a fresh interpreter (so nothing is cached)
+several times; the median import time and peak RSS are reported. The script
+exits non-zero when a worker module exceeds its budget or pulls in the Flask
+web stack.
+
+    python benchmarks/startup.py [--runs 5] [--budget-ms 500] [--budget-rss-mb 80]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the worker processes import; they must stay free of the web stack
+WORKER_MODULES = ('visa_listener', 'notification_sender')
+# Reported for comparison only
+REFERENCE_MODULES = ('app',)
+WEB_MODULES = ('flask', 'flask_sqlalchemy', 'flask_wtf', 'wtforms', 'email_validator', 'forms')
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'ms': elapsed * 1000,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'web': sorted(m for m in {web!r} if m in sys.modules),
+}}))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    env = dict(os.environ)
+    # Importing app needs a database URL; nothing connects during import
+    env.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, web=WEB_MODULES)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'ms': statistics.median(sample['ms'] for sample in samples),
+        'rss_mb': statistics.median(sample['rss_mb'] for sample in samples),
+        'web': samples[-1]['web'],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=500.0)
+    parser.add_argument('--budget-rss-mb', type=float, default=80.0)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<22}{'import ms':>10}{'peak RSS MB':>13}  web stack")
+    for module in WORKER_MODULES + REFERENCE_MODULES:
+        result = measure(module, args.runs)
+        verdict = ''
+        if module in WORKER_MODULES:
+            over = result['ms'] > args.budget_ms or result['rss_mb'] > args.budget_rss_mb or result['web']
+            verdict = '  OVER BUDGET' if over else '  ok'
+            failed = failed or bool(over)
+        print(f"{module:<22}{result['ms']:>10.1f}{result['rss_mb']:>13.1f}  "
+              f"{', '.join(result['web']) or '-'}{verdict}")
+
+    print(f"Budget for worker modules: {args.budget_ms:.0f} ms, {args.budget_rss_mb:.0f} MB, no web stack.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Deadline distance (days) -> multiple of the base interval between checks
+URGENCY_STEPS = ((14, 1), (60, 4))
+DISTANT_MULTIPLIER = 16
+# Consecutive checks without a matching slot double the interval up to this many times
+MAX_BACKOFF_STEPS = 3
+
+
+class CheckScheduler:
+    """
+    Heap of next-due times (time.monotonic()) for account checks.
+
+    Accounts with a close deadline are re-checked every `base_interval`,
+    distant ones less often, and accounts that keep coming up empty back off
+    further (capped at `max_interval`). Accounts whose deadline has passed
+    are retired until their window changes. Rescheduling pushes a new heap
+    entry; stale entries are skipped when popped.
+    """
+
+    def __init__(self, base_interval: float, max_interval: Optional[float] = None):
+        self.base_interval = base_interval
+        self.max_interval = max_interval or base_interval * DISTANT_MULTIPLIER * 2 ** MAX_BACKOFF_STEPS
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        self._misses: Dict[int, int] = {}
+        self.retired: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def clear(self):
+        self._heap = []
+        self._due.clear()
+        self._misses.clear()
+        self.retired.clear()
+
+    def _push(self, account_id: int, at: float):
+        self._due[account_id] = at
+        heapq.heappush(self._heap, (at, account_id))
+
+    def touch(self, account_id: int, now: float):
+        """Makes an account due now, e.g. because its target window changed."""
+        self.retired.discard(account_id)
+        self._misses.pop(account_id, None)
+        self._push(account_id, now)
+
+    def touch_all(self, now: float):
+        """Makes every scheduled account due now (the slot schedule changed)."""
+        self._due = dict.fromkeys(self._due, now)
+        self._heap = [(now, account_id) for account_id in self._due]
+        heapq.heapify(self._heap)
+
+    def export(self, now: float) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """Seconds until each account is due (0 if overdue) and miss counts, e.g. for a snapshot."""
+        return {account_id: max(0.0, at - now) for account_id, at in self._due.items()}, dict(self._misses)
+
+    def restore(self, due_in: Dict[int, float], misses: Dict[int, int], retired: Iterable[int], now: float):
+        """Replaces the schedule with one exported by export(), counted from `now`."""
+        self._due = {account_id: now + seconds for account_id, seconds in due_in.items()}
+        self._heap = [(at, account_id) for account_id, at in self._due.items()]
+        heapq.heapify(self._heap)
+        self._misses = dict(misses)
+        self.retired = set(retired)
+
+    def discard(self, account_id: int):
+        self._due.pop(account_id, None)
+        self._misses.pop(account_id, None)
+        self.retired.discard(account_id)
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[int]:
+        """Removes and returns the accounts due at `now`, most overdue first."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, account_id = heapq.heappop(self._heap)
+            if self._due.get(account_id) == at:
+                del self._due[account_id]
+                due.append(account_id)
+        return due
+
+    def reschedule(self, account_id: int, now: float, days_left: int, matched: bool) -> bool:
+        """
+        Schedules an account's next check from its deadline distance and
+        whether it had matching slots. Returns False if it was retired instead.
+        """
+        if days_left < 0:
+            self._misses.pop(account_id, None)
+            self.retired.add(account_id)
+            return False
+
+        misses = 0 if matched else min(self._misses.get(account_id, -1) + 1, MAX_BACKOFF_STEPS)
+        self._misses[account_id] = misses
+
+        multiplier = next((m for days, m in URGENCY_STEPS if days_left <= days), DISTANT_MULTIPLIER)
+        interval = min(self.base_interval * multiplier * 2 ** misses, self.max_interval)
+        self._push(account_id, now + interval)
+        return True
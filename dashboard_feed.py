@@ -0,0 +1,365 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from dashboard_query import DASHBOARD_COLUMNS
+from metrics import REGISTRY
+from models import ListenerCycle, NotificationOutbox, VisaAccount
+
+# How often the shared poller looks for changes (one set of queries per web process),
+# and how often a dashboard without a held stream reconnects
+POLL_SECONDS = float(os.getenv('DASHBOARD_POLL_SECONDS', '2'))
+# A held stream ends after this long, well within gunicorn's request timeout, and
+# EventSource reconnects, resuming from Last-Event-ID
+STREAM_SECONDS = float(os.getenv('DASHBOARD_STREAM_SECONDS', '25'))
+KEEPALIVE_SECONDS = 10
+# Polling stops this long after the last dashboard request, and a page's
+# accounts stop being watched this long after it last asked
+IDLE_SECONDS = 60
+# Batches kept for dashboards that are a few polls behind
+REPLAY_BATCHES = 64
+# Accounts watched per dashboard page and per process
+MAX_STREAM_IDS = 200
+MAX_WATCHED_IDS = 2000
+# More changed accounts than this in one poll (a bulk import) are only counted
+MAX_ACCOUNT_ROWS = 500
+# Newest alert previews sent per poll, and how much of each
+MAX_ALERTS = 20
+ALERT_PREVIEW_CHARS = 300
+# Newest listener cycle summaries sent per poll
+MAX_CYCLES = 10
+
+STREAMS = REGISTRY.gauge('dashboard_streams', 'Live dashboard streams held open in this process.')
+REQUESTS = REGISTRY.counter('dashboard_feed_requests_total', 'Live dashboard change lookups.')
+CATCH_UPS = REGISTRY.counter(
+    'dashboard_feed_catch_ups_total', 'Live dashboard requests answered with their own query (cursor too old).'
+)
+POLL_ERRORS = REGISTRY.counter('dashboard_feed_poll_errors_total', 'Failed live dashboard change polls.')
+
+MARK_KEYS = ('updated', 'outbox', 'cycle')
+
+
+def _truncate(text: str) -> str:
+    return text if len(text) <= ALERT_PREVIEW_CHARS else text[:ALERT_PREVIEW_CHARS] + '…'
+
+
+def _format_time(value: Optional[datetime]) -> Optional[str]:
+    # Same format as dashboard.html
+    return value.strftime('%Y-%m-%d %H:%M:%S UTC') if value else None
+
+
+def parse_ids(value: str) -> Set[int]:
+    """Account ids from a comma-separated query parameter; malformed entries are skipped."""
+    ids = {int(part) for part in value.split(',') if part.strip().isdigit()}
+    return set(sorted(ids)[:MAX_STREAM_IDS])
+
+
+def encode_cursor(marks: Dict) -> str:
+    return f"{marks['updated'].isoformat()}_{marks['outbox']}_{marks['cycle'].isoformat()}"
+
+
+def parse_cursor(value: str) -> Optional[Dict]:
+    """
+    The watermarks a dashboard has seen, or None if missing or malformed.
+    They come from the database, not from one process, so any web worker
+    can answer the next request.
+    """
+    try:
+        updated, outbox, cycle = value.split('_')
+        return {'updated': datetime.fromisoformat(updated), 'outbox': int(outbox),
+                'cycle': datetime.fromisoformat(cycle)}
+    except ValueError:
+        return None
+
+
+def _newer(marks: Dict, than: Dict) -> bool:
+    return any(marks[key] > than[key] for key in MARK_KEYS)
+
+
+class Batch:
+    """Changes found by one poll (or one catch-up query), between two sets of watermarks."""
+
+    def __init__(self, since: Dict):
+        self.since = dict(since)
+        self.marks = dict(since)
+        self.accounts: Dict[int, Dict] = {}
+        self.removed: Set[int] = set()
+        # account id -> updated_at, for the accounts above
+        self.changed_at: Dict[int, datetime] = {}
+        self.bulk_changes = 0
+        self.checked: Dict[int, datetime] = {}
+        self.alerts: List[Dict] = []
+        # (finished_at, summary)
+        self.cycles: List[Tuple[datetime, Dict]] = []
+
+
+def merge(batches: List[Batch], since: Dict, account_ids: Set[int]) -> Dict:
+    """
+    The diff one dashboard page needs from `batches`, leaving out what it saw
+    before `since`: full rows only for accounts it shows, a count for the rest.
+    """
+    accounts: Dict[int, Dict] = {}
+    removed: Set[int] = set()
+    other: Set[int] = set()
+    bulk, alerts, cycles = 0, [], []
+    for batch in batches:
+        if batch.marks['updated'] > since['updated']:
+            bulk += batch.bulk_changes
+        for account_id, changed_at in batch.changed_at.items():
+            if changed_at <= since['updated']:
+                continue
+            if account_id not in account_ids:
+                other.add(account_id)
+            elif account_id in batch.removed:
+                accounts.pop(account_id, None)
+                removed.add(account_id)
+            else:
+                removed.discard(account_id)
+                accounts[account_id] = batch.accounts[account_id]
+        alerts[:0] = [alert for alert in batch.alerts if alert['id'] > since['outbox']]
+        cycles.extend(summary for finished_at, summary in batch.cycles if finished_at > since['cycle'])
+
+    changes = {}
+    for key, value in (('accounts', [accounts[i] for i in sorted(accounts)]), ('removed', sorted(removed)),
+                       ('other', bulk + len(other)), ('alerts', alerts[:MAX_ALERTS]),
+                       ('cycles', cycles[-MAX_CYCLES:])):
+        if value:
+            changes[key] = value
+    # Every new outbox row, including the account alerts that have no preview
+    newest = max((batch.marks['outbox'] for batch in batches), default=since['outbox'])
+    if newest > since['outbox']:
+        changes['alert_count'] = newest - since['outbox']
+    return changes
+
+
+class DashboardHub:
+    """
+    One change poller per web process, shared by every open dashboard.
+
+    While dashboards are connected, a background thread runs a fixed set of
+    indexed queries every `poll_seconds` (accounts changed, last_checked of
+    the accounts on open pages, new outbox alerts, listener cycle summaries)
+    and keeps the recent batches, so database cost depends on the number of
+    web processes, not on the number of open dashboards.
+
+    Dashboards read them as Server-Sent Events (`stream()`), whose event id
+    is a cursor of database watermarks: any process can resume a stream, and
+    one whose cursor is older than its kept batches (the previous connection
+    went to another process, or this poller was idle) catches it up with one
+    bounded query of its own. At most `max_streams` streams per process are
+    held open, each for STREAM_SECONDS; the rest are answered at once and
+    reconnect after `poll_seconds`, so live dashboards never take every
+    request thread.
+    """
+
+    def __init__(self, engine, poll_seconds: float = POLL_SECONDS, max_streams: int = 0):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        # Notified after every poll
+        self._polled = threading.Condition(self._lock)
+        self._stream_slots = threading.BoundedSemaphore(max_streams) if max_streams > 0 else None
+        # account id -> monotonic time a dashboard showing it last asked
+        self._watched: Dict[int, float] = {}
+        self._last_request = 0.0
+        self._recent: Deque[Batch] = deque(maxlen=REPLAY_BATCHES)
+        self._thread: Optional[threading.Thread] = None
+        # Watermarks of the last poll; None until the poller's first pass
+        self._marks: Optional[Dict] = None
+        # last_checked of the watched accounts, as of the last poll
+        self._checked: Dict[int, datetime] = {}
+
+    def changes(self, account_ids: Set[int], cursor: str = '') -> Dict:
+        """
+        What changed for one dashboard page since `cursor`: the diff, with the
+        current last_checked of its accounts, and the cursor to resume from.
+        Without a valid cursor, starts from now.
+        """
+        REQUESTS.inc()
+        since = parse_cursor(cursor)
+        now = time.monotonic()
+        with self._lock:
+            self._last_request = now
+            for account_id in account_ids:
+                self._watched[account_id] = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dashboard-feed', daemon=True)
+                self._thread.start()
+            marks = self._marks
+            floor = self._recent[0].since if self._recent else marks
+            batches = list(self._recent)
+            checked = {i: _format_time(self._checked[i]) for i in sorted(account_ids) if i in self._checked}
+
+        if marks is None or (since is not None and _newer(floor, since)):
+            with Session(self.engine) as session:
+                if since is None:
+                    marks = self._current_marks(session)
+                else:
+                    CATCH_UPS.inc()
+                    batch = self._changes(session, since, [])
+                    batches, marks = [batch], batch.marks
+        diff = {}
+        if since is not None:
+            diff = merge([batch for batch in batches if _newer(batch.marks, since)], since, account_ids)
+            # Another process may have polled further than this one
+            marks = {key: max(marks[key], since[key]) for key in MARK_KEYS}
+        if checked:
+            diff['checked'] = checked
+        return {'cursor': encode_cursor(marks), 'changes': diff}
+
+    def stream(self, account_ids: Set[int], last_event_id: str = '') -> Iterator[str]:
+        """
+        Server-Sent Events for one dashboard page, resuming after `last_event_id`.
+        Held open for up to STREAM_SECONDS if a stream slot is free, otherwise
+        ends after the first answer.
+        """
+        held = self._stream_slots is not None and self._stream_slots.acquire(blocking=False)
+        if held:
+            STREAMS.inc()
+        try:
+            yield f'retry: {int(self.poll_seconds * 1000)}\n\n'
+            cursor, sent_checked = last_event_id, {}
+            deadline = time.monotonic() + (STREAM_SECONDS if held else 0)
+            quiet_since = time.monotonic()
+            first = True
+            while True:
+                answer = self.changes(account_ids, cursor)
+                diff = answer['changes']
+                # last_checked is reported in full each time; only values not yet sent go out
+                checked = {i: value for i, value in diff.pop('checked', {}).items() if sent_checked.get(i) != value}
+                if checked:
+                    diff['checked'] = checked
+                    sent_checked.update(checked)
+                if first or diff or answer['cursor'] != cursor:
+                    # Every connection gets at least one event; an empty diff still advances Last-Event-ID
+                    first = False
+                    cursor = answer['cursor']
+                    yield f'id: {cursor}\nevent: changes\ndata: {json.dumps(diff)}\n\n'
+                    quiet_since = time.monotonic()
+                elif time.monotonic() - quiet_since >= KEEPALIVE_SECONDS:
+                    # Also how a closed connection is noticed
+                    yield ': keepalive\n\n'
+                    quiet_since = time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                with self._polled:
+                    self._polled.wait(min(remaining, KEEPALIVE_SECONDS))
+        finally:
+            if held:
+                self._stream_slots.release()
+                STREAMS.dec()
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+            except Exception as e:
+                POLL_ERRORS.inc()
+                logging.error(f"Live dashboard poll failed: {e}")
+            with self._lock:
+                now = time.monotonic()
+                for account_id in [i for i, seen in self._watched.items() if now - seen >= IDLE_SECONDS]:
+                    del self._watched[account_id]
+                if now - self._last_request >= IDLE_SECONDS:
+                    # Start over from fresh watermarks on the next request
+                    self._thread = None
+                    self._marks = None
+                    self._checked.clear()
+                    self._recent.clear()
+                    return
+            time.sleep(self.poll_seconds)
+
+    def _poll(self):
+        with self._lock:
+            watched = sorted(self._watched)[:MAX_WATCHED_IDS]
+            marks = self._marks
+        with Session(self.engine) as session:
+            if marks is None:
+                marks = self._current_marks(session)
+                with self._lock:
+                    self._marks = marks
+                return
+            batch = self._changes(session, marks, watched)
+        with self._lock:
+            self._marks = batch.marks
+            self._checked = batch.checked
+            if _newer(batch.marks, batch.since):
+                self._recent.append(batch)
+            self._polled.notify_all()
+
+    def _current_marks(self, session) -> Dict:
+        updated, outbox, cycle = session.execute(select(
+            select(func.max(VisaAccount.updated_at)).scalar_subquery(),
+            select(func.max(NotificationOutbox.id)).scalar_subquery(),
+            select(func.max(ListenerCycle.finished_at)).scalar_subquery(),
+        )).one()
+        epoch = datetime(1970, 1, 1)
+        return {'updated': updated or epoch, 'outbox': outbox or 0, 'cycle': cycle or epoch}
+
+    def _changes(self, session, since: Dict, watched: List[int]) -> Batch:
+        batch = Batch(since)
+        marks = batch.marks
+
+        # 1. Accounts added, edited or deleted by the web app
+        rows = session.execute(
+            select(*DASHBOARD_COLUMNS, VisaAccount.updated_at, VisaAccount.deleted_at)
+            .where(VisaAccount.updated_at > since['updated'])
+            .limit(MAX_ACCOUNT_ROWS + 1)
+        ).all()
+        if len(rows) > MAX_ACCOUNT_ROWS:
+            batch.bulk_changes = session.scalar(
+                select(func.count()).select_from(VisaAccount).where(VisaAccount.updated_at > since['updated'])
+            )
+            marks['updated'] = session.scalar(select(func.max(VisaAccount.updated_at)))
+            rows = []
+        for row in rows:
+            marks['updated'] = max(marks['updated'], row.updated_at)
+            batch.changed_at[row.id] = row.updated_at
+            if row.deleted_at is not None:
+                batch.removed.add(row.id)
+                continue
+            account = {column.key: getattr(row, column.key) for column in DASHBOARD_COLUMNS}
+            account['last_checked'] = _format_time(account['last_checked'])
+            batch.accounts[row.id] = account
+
+        # 2. last_checked of the accounts on open pages (primary key lookups); every request
+        # reports the current values for its page, so these are not diffed
+        if watched:
+            batch.checked = dict(session.execute(
+                select(VisaAccount.id, VisaAccount.last_checked).where(VisaAccount.id.in_(watched))
+            ).tuples().all())
+
+        # 3. New alerts in the outbox, newest first. Only their previews are shown: the
+        # message text names accounts and their emails, and this page is public
+        alerts = session.execute(
+            select(NotificationOutbox.id, NotificationOutbox.created_at, NotificationOutbox.preview)
+            .where(NotificationOutbox.id > since['outbox'])
+            .order_by(NotificationOutbox.id.desc())
+            .limit(MAX_ALERTS)
+        ).all()
+        if alerts:
+            marks['outbox'] = alerts[0].id
+            batch.alerts = [{'id': row.id, 'created_at': _format_time(row.created_at), 'text': _truncate(row.preview)}
+                            for row in alerts if row.preview]
+
+        # 4. Listener cycle summaries, the newest few
+        cycles = session.scalars(
+            select(ListenerCycle).where(ListenerCycle.finished_at > since['cycle'])
+            .order_by(ListenerCycle.finished_at.desc()).limit(MAX_CYCLES)
+        ).all()
+        for cycle in reversed(cycles):
+            marks['cycle'] = max(marks['cycle'], cycle.finished_at)
+            batch.cycles.append((cycle.finished_at, {
+                'worker_id': cycle.worker_id, 'finished_at': _format_time(cycle.finished_at),
+                'summary': json.loads(cycle.summary),
+            }))
+        return batch
@@ -0,0 +1,128 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+
+from models import VisaAccount
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Only what dashboard.html renders (never the password or email)
+DASHBOARD_COLUMNS = (
+    VisaAccount.id, VisaAccount.unique_id, VisaAccount.first_name, VisaAccount.last_name,
+    VisaAccount.appointment_type, VisaAccount.target_month_year,
+    VisaAccount.target_day_start, VisaAccount.target_day_end, VisaAccount.last_checked,
+)
+
+# Each sort key is backed by a (column, id) index, see VisaAccount.__table_args__
+SORT_COLUMNS = {
+    'id': VisaAccount.id,
+    'target_month_year': VisaAccount.target_month_year,
+    'appointment_type': VisaAccount.appointment_type,
+    'last_checked': VisaAccount.last_checked,
+}
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def encode_cursor(value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], sort: str) -> Optional[Tuple]:
+    if not cursor:
+        return None
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if sort == 'last_checked':
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_args(args) -> Dict:
+    """Normalizes the dashboard query string; unknown or malformed values fall back to defaults."""
+    sort = args.get('sort', 'id')
+    if sort not in SORT_COLUMNS:
+        sort = 'id'
+    try:
+        per_page = min(max(int(args.get('per_page', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        per_page = PAGE_SIZE
+    return {
+        'sort': sort,
+        'order': 'desc' if args.get('order') == 'desc' else 'asc',
+        'month': args.get('month') or None,
+        'type': args.get('type') or None,
+        'checked_after': _parse_datetime(args.get('checked_after')),
+        'checked_before': _parse_datetime(args.get('checked_before')),
+        'per_page': per_page,
+        'after': decode_cursor(args.get('after'), sort),
+    }
+
+
+def fetch_page(session, params: Dict) -> Tuple[List, Optional[str]]:
+    """Returns one page of rows and the cursor for the next page (None on the last page)."""
+    column = SORT_COLUMNS[params['sort']]
+    descending = params['order'] == 'desc'
+
+    query = select(*DASHBOARD_COLUMNS).where(VisaAccount.deleted_at.is_(None))
+    if params['month']:
+        query = query.where(VisaAccount.target_month_year == params['month'])
+    if params['type']:
+        query = query.where(VisaAccount.appointment_type == params['type'])
+    if params['checked_after']:
+        query = query.where(VisaAccount.last_checked >= params['checked_after'])
+    if params['checked_before']:
+        query = query.where(VisaAccount.last_checked < params['checked_before'])
+
+    if params['after']:
+        value, row_id = params['after']
+        if column is VisaAccount.id:
+            query = query.where(VisaAccount.id < row_id if descending else VisaAccount.id > row_id)
+        else:
+            # Row-value comparison keeps the (column, id) index usable
+            position = tuple_(column, VisaAccount.id)
+            query = query.where(position < (value, row_id) if descending else position > (value, row_id))
+
+    order = (column, VisaAccount.id) if column is not VisaAccount.id else (VisaAccount.id,)
+    query = query.order_by(*(key.desc() if descending else key.asc() for key in order))
+
+    rows = session.execute(query.limit(params['per_page'] + 1)).all()
+    next_cursor = None
+    if len(rows) > params['per_page']:
+        rows = rows[:params['per_page']]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, params['sort']), last.id)
+    return rows, next_cursor
+
+
+def table_version(session) -> Tuple[str, Optional[datetime]]:
+    """
+    Cheap validator for every dashboard page: the newest updated_at (covers adds
+    and soft deletes) and last_checked, both index lookups.
+    Returns (version string, last-modified time).
+    """
+    updated, checked = session.execute(
+        select(func.max(VisaAccount.updated_at), func.max(VisaAccount.last_checked))
+    ).one()
+    stamps = [stamp for stamp in (updated, checked) if stamp is not None]
+    last_modified = max(stamps) if stamps else None
+    return f'{updated}|{checked}', last_modified
+
+
+def page_etag(version: str, query_string: bytes) -> str:
+    return hashlib.sha1(version.encode() + b'?' + query_string).hexdigest()
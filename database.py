@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
+
+from metrics import REGISTRY
+
+load_dotenv()
+
+# Relative SQLite paths resolve here, matching Flask-SQLAlchemy's instance folder
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# Threads running blocking database work for asyncio code (see run_db). The
+# engine's pool keeps one connection per thread, plus one for LISTEN on Postgres.
+DB_THREADS = int(os.getenv('DB_THREADS', '4'))
+
+# Postgres pool settings. Connections are replaced after DB_POOL_RECYCLE seconds, before
+# server or proxy idle timeouts drop them, and checked with a ping before every checkout.
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Extra connections a burst may open beyond pool_size (closed again when returned)
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '4'))
+# Seconds to wait for a free pooled connection, and for a new one to connect
+DB_POOL_TIMEOUT = 10
+DB_CONNECT_TIMEOUT = 10
+# Seconds a SQLite connection waits for another process's write lock before failing
+SQLITE_BUSY_TIMEOUT = 15
+
+_engine: Optional[Engine] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+T = TypeVar('T')
+
+QUERY_SECONDS = REGISTRY.histogram('db_query_seconds', 'Time spent executing SQL statements.')
+QUERIES = REGISTRY.counter('db_queries_total', 'SQL statements executed.')
+EXECUTOR_WAIT_SECONDS = REGISTRY.histogram('db_executor_wait_seconds',
+                                           'Time database work waited for a free database thread.')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    QUERY_SECONDS.observe(time.perf_counter() - context._metrics_started)
+    QUERIES.inc()
+
+
+def instrument_engine(engine: Engine):
+    """Counts and times every statement the engine executes."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def database_url() -> str:
+    """DATABASE_URL as the web app would resolve it."""
+    url = make_url(os.environ['DATABASE_URL'])
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not os.path.isabs(url.database):
+        os.makedirs(INSTANCE_PATH, exist_ok=True)
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url.render_as_string(hide_password=False)
+
+
+def engine_options(url: str, pool_size: int) -> Dict:
+    """
+    create_engine() keyword arguments for the backend in `url`, for a process
+    using up to `pool_size` connections at once. Long-running processes outlive
+    idle server-side connections, so those are pinged and recycled. SQLite keeps
+    its driver's default pool and only waits out concurrent writers.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT}}
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_size': pool_size,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+    }
+    if backend == 'postgresql':
+        options['connect_args'] = {'connect_timeout': DB_CONNECT_TIMEOUT}
+    return options
+
+
+def get_engine() -> Engine:
+    """The process-wide engine for background workers, created on first use."""
+    global _engine
+    if _engine is None:
+        url = database_url()
+        _engine = create_engine(url, **engine_options(url, DB_THREADS + 1))
+        instrument_engine(_engine)
+    return _engine
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    A plain SQLAlchemy session for code running outside Flask (listener, sender).
+    The caller commits or rolls back; the session is always closed.
+    """
+    session = Session(get_engine())
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The process-wide pool of database threads, created on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+    return _executor
+
+
+def _timed_call(submitted: float, func: Callable[..., T], args) -> T:
+    EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+    return func(*args)
+
+
+async def run_db(func: Callable[..., T], *args) -> T:
+    """
+    Runs blocking database work (`func(*args)`, typically opening its own
+    session_scope) on the database threads, so the event loop keeps serving
+    other tasks meanwhile. Exceptions propagate to the caller.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _timed_call, time.perf_counter(), func, args)
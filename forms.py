@@ -61,6 +61,11 @@ class AddAccountForm(FlaskForm):
         validators=[Optional(), NumberRange(min=1, max=31)]
     )
 
+    telegram_chat_id = IntegerField(
+        'Telegram Chat ID (Optional: also send this account\'s alerts there)',
+        validators=[Optional()]
+    )
+
     submit = SubmitField('Add Account') 
     import datetime
 from flask_wtf import FlaskForm
@@ -125,4 +130,9 @@ class AddAccountForm(FlaskForm):
         validators=[Optional(), NumberRange(min=1, max=31)]
     )
 
+    telegram_chat_id = IntegerField(
+        'Telegram Chat ID (Optional: also send this account\'s alerts there)',
+        validators=[Optional()]
+    )
+
     submit = SubmitField('Add Account')
\ No newline at end of file
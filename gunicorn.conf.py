@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Settings for the web process: gunicorn -c gunicorn.conf.py app:app (see Procfile).
+#
+# WEB_CONCURRENCY worker processes, each serving WEB_THREADS requests at once on
+# threads. Every worker pools WEB_THREADS + 1 database connections (app.py), so
+# the web tier needs up to WEB_CONCURRENCY * (WEB_THREADS + 1 + DB_MAX_OVERFLOW)
+# Postgres connections; the listener and sender take DB_THREADS + 1 each.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# The usual 2 x cores + 1, capped: containers often report the host's cores
+workers = int(os.getenv('WEB_CONCURRENCY', min(2 * multiprocessing.cpu_count() + 1, 8)))
+
+# Requests mostly wait on the database, so threads add concurrency cheaply.
+# Live dashboard streams (/dashboard/events) hold a thread for up to
+# DASHBOARD_STREAM_SECONDS, but only on DASHBOARD_MAX_STREAMS of them (default
+# half); past that, dashboards reconnect every DASHBOARD_POLL_SECONDS instead.
+threads = int(os.getenv('WEB_THREADS', '4'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+graceful_timeout = 30
+# Idle keep-alive connections are closed after this many seconds
+keepalive = 5
+
+# Workers are replaced after this many requests (staggered) to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+# Access log on stdout when WEB_ACCESS_LOG is set
+accesslog = '-' if os.getenv('WEB_ACCESS_LOG') else None
@@ -0,0 +1,212 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Optional, Set, Tuple
+
+from account_feed import AccountRecord
+from slot_index import bitmap_from_bytes, bitmap_to_bytes
+from slot_sources import Calendar
+
+# File layout: prefix, JSON metadata, then the payload sections listed in the metadata
+# (int64 columns, UTF-8 text blobs with a length column each and the concatenated alert bitmaps)
+MAGIC = b'VSLSNAP\x00'
+# Bump on any layout change; files of another version are ignored
+FORMAT_VERSION = 2
+# magic, format version, metadata length, payload length, CRC-32 of metadata and payload
+_PREFIX = struct.Struct('<8sIIQI')
+
+# Per-account int64 columns; -1 (or 0 for the chat id) stands for None
+INT_COLUMNS = ('id', 'target_day_start', 'target_day_end', 'telegram_chat_id',
+               'lo', 'hi', 'due_ms', 'misses', 'retired')
+TEXT_COLUMNS = ('unique_id', 'email', 'first_name', 'last_name', 'target_month_year')
+
+
+def _int64(values) -> bytes:
+    column = array('q', values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_int64(data) -> array:
+    column = array('q')
+    column.frombytes(data)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+
+def _text_sections(name: str, values: List[str]) -> List[Tuple[str, bytes]]:
+    """
+    Strings as one UTF-8 blob plus their lengths (in characters). No separator
+    is used, since account fields may contain any character, NUL included.
+    """
+    return [(name, ''.join(values).encode()), (f'{name}_lengths', _int64(len(value) for value in values))]
+
+
+def _split_text(blob: bytes, lengths) -> List[str]:
+    text = str(blob, 'utf-8')
+    ends = list(accumulate(lengths))
+    if (ends[-1] if ends else 0) != len(text):
+        raise ValueError('snapshot text lengths do not match')
+    return [text[end - length:end] for end, length in zip(ends, lengths)]
+
+
+class ListenerSnapshot:
+    """
+    The listener's warm state at one moment: accounts with their target
+    windows and check schedule, alert bitmaps, and every location's calendar.
+
+    Written as one versioned, checksummed binary file (atomically replaced);
+    read back through mmap, column by column. Scheduler times are stored as
+    offsets from `created_at` (wall clock), since monotonic time does not
+    survive a restart. Whether the state still matches the database is for
+    the caller to check.
+    """
+
+    def __init__(self, created_at: float, base_ordinal: int, watermark: Optional[str], database: str,
+                 calendars: Dict[str, Calendar], accounts: List[AccountRecord],
+                 windows: Dict[int, Tuple[int, int]], due: Dict[int, float], misses: Dict[int, int],
+                 retired: Set[int], notified: Dict[str, int]):
+        self.created_at = created_at
+        self.base_ordinal = base_ordinal
+        # AccountChangeFeed watermark (ISO format)
+        self.watermark = watermark
+        # Identifies the database the state came from (URL without credentials)
+        self.database = database
+        self.calendars = calendars
+        self.accounts = accounts
+        self.windows = windows
+        self.due = due
+        self.misses = misses
+        self.retired = retired
+        self.notified = notified
+
+    def dump(self, path: str):
+        accounts = self.accounts
+        columns = {
+            'id': [a.id for a in accounts],
+            'target_day_start': [a.target_day_start for a in accounts],
+            'target_day_end': [-1 if a.target_day_end is None else a.target_day_end for a in accounts],
+            'telegram_chat_id': [a.telegram_chat_id or 0 for a in accounts],
+            'lo': [self.windows.get(a.id, (-1, -1))[0] for a in accounts],
+            'hi': [self.windows.get(a.id, (-1, -1))[1] for a in accounts],
+            'due_ms': [int(self.due[a.id] * 1000) if a.id in self.due else -1 for a in accounts],
+            'misses': [self.misses.get(a.id, -1) for a in accounts],
+            'retired': [a.id in self.retired for a in accounts],
+        }
+        keys = list(self.notified)
+        bitmaps = [bitmap_to_bytes(self.notified[key]) for key in keys]
+
+        sections = [(name, _int64(columns[name])) for name in INT_COLUMNS]
+        sections += _text_sections('text', [getattr(a, name) for a in accounts for name in TEXT_COLUMNS])
+        sections += _text_sections('notified_keys', keys)
+        sections += [
+            ('notified_lengths', _int64(len(bitmap) for bitmap in bitmaps)),
+            ('notified_bitmaps', b''.join(bitmaps)),
+        ]
+        offsets, position = {}, 0
+        for name, data in sections:
+            offsets[name] = [position, len(data)]
+            position += len(data)
+
+        meta = json.dumps({
+            'created_at': self.created_at,
+            'base_ordinal': self.base_ordinal,
+            'watermark': self.watermark,
+            'database': self.database,
+            'calendars': {location: [[year, month, mask] for (year, month), mask in calendar.items()]
+                          for location, calendar in self.calendars.items()},
+            'accounts': len(accounts),
+            'notified': len(keys),
+            'sections': offsets,
+        }).encode()
+        checksum = zlib.crc32(meta)
+        for _, data in sections:
+            checksum = zlib.crc32(data, checksum)
+
+        # Written beside the target and renamed over it, so readers never see a partial file
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(meta), position, checksum))
+            f.write(meta)
+            for _, data in sections:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ListenerSnapshot':
+        """Maps and decodes a snapshot file. Raises ValueError if it is not a valid current-version snapshot."""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return cls._decode(mapped)
+
+    @classmethod
+    def _decode(cls, mapped: mmap.mmap) -> 'ListenerSnapshot':
+        if len(mapped) < _PREFIX.size:
+            raise ValueError('truncated snapshot')
+        magic, version, meta_length, payload_length, checksum = _PREFIX.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError('not a listener snapshot')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'snapshot format {version}, expected {FORMAT_VERSION}')
+        start = _PREFIX.size
+        if len(mapped) != start + meta_length + payload_length:
+            raise ValueError('truncated snapshot')
+        # Checksummed in place; the views must be released before the map is closed
+        with memoryview(mapped) as view, view[start:] as body:
+            if zlib.crc32(body) != checksum:
+                raise ValueError('snapshot checksum mismatch')
+
+        meta = json.loads(mapped[start:start + meta_length])
+        payload_start = start + meta_length
+
+        def section(name: str) -> bytes:
+            # Each section is copied out of the map once, straight into its array or string
+            offset, length = meta['sections'][name]
+            return mapped[payload_start + offset:payload_start + offset + length]
+
+        columns = [_from_int64(section(name)) for name in INT_COLUMNS]
+        texts = _split_text(section('text'), _from_int64(section('text_lengths')))
+        if len(texts) != len(TEXT_COLUMNS) * meta['accounts'] or any(len(column) != meta['accounts']
+                                                                     for column in columns):
+            raise ValueError('snapshot columns do not match the account count')
+        texts = iter(texts)
+        # One iterator repeated: each zip step takes the next account's text fields
+        text_rows = zip(*[texts] * len(TEXT_COLUMNS))
+        accounts, windows, due, misses, retired = [], {}, {}, {}, set()
+        for (account_id, day_start, day_end, chat_id, lo, hi, due_ms, miss_count, is_retired), \
+                (unique_id, email, first_name, last_name, target_month_year) in zip(zip(*columns), text_rows):
+            accounts.append(AccountRecord(
+                account_id, unique_id, email, first_name, last_name, target_month_year,
+                day_start, None if day_end < 0 else day_end, chat_id or None,
+            ))
+            if hi >= 0:
+                windows[account_id] = (lo, hi)
+            if due_ms >= 0:
+                due[account_id] = due_ms / 1000
+            if miss_count >= 0:
+                misses[account_id] = miss_count
+            if is_retired:
+                retired.add(account_id)
+
+        notified = {}
+        if meta['notified']:
+            keys = _split_text(section('notified_keys'), _from_int64(section('notified_keys_lengths')))
+            bitmaps, position = section('notified_bitmaps'), 0
+            for key, length in zip(keys, _from_int64(section('notified_lengths'))):
+                notified[key] = bitmap_from_bytes(bitmaps[position:position + length])
+                position += length
+
+        return cls(
+            meta['created_at'], meta['base_ordinal'], meta['watermark'], meta['database'],
+            {location: {(year, month): mask for year, month, mask in months}
+             for location, months in meta['calendars'].items()},
+            accounts, windows, due, misses, retired, notified,
+        )
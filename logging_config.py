@@ -0,0 +1,120 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Records logged with extra={'sample': key} pass at most SAMPLE_BURST times per SAMPLE_SECONDS per key
+SAMPLE_BURST = 10
+SAMPLE_SECONDS = 60.0
+
+# Libraries that log every HTTP request at INFO (python-telegram-bot's client)
+QUIET_LOGGERS = ('httpx', 'httpcore')
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limits repetitive records, e.g. one line per account: records tagged
+    with extra={'sample': key} pass `burst` times per `window` seconds per key,
+    and the next one let through carries the number dropped in between
+    (record.suppressed). Untagged records always pass.
+    """
+
+    def __init__(self, burst: int = SAMPLE_BURST, window: float = SAMPLE_SECONDS):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> (window start, records passed in it, records suppressed since the last pass)
+        self._keys: Dict[str, Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            started, passed, suppressed = self._keys.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                started, passed = now, 0
+            if passed >= self.burst:
+                self._keys[key] = (started, passed, suppressed + 1)
+                return False
+            self._keys[key] = (started, passed + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, noting how many similar records sampling dropped."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{line} (+{suppressed} similar suppressed)" if suppressed else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger and message, plus every `extra` field."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging(level: Optional[str] = None, json_format: Optional[bool] = None) -> logging.handlers.QueueListener:
+    """
+    Routes the root logger through a queue: logging calls (on the event loop)
+    only filter and enqueue, and a background thread formats and writes to
+    stderr. LOG_LEVEL and LOG_FORMAT (text or json) apply unless given.
+    Calling it again only changes the level and format, and only those given.
+    """
+    global _listener
+    if _listener is not None and level is None and json_format is None:
+        return _listener
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    if json_format is None:
+        json_format = os.getenv('LOG_FORMAT', 'text').lower() == 'json'
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(log_queue)
+        # Sampled records are dropped before they are queued
+        handler.addFilter(SamplingFilter())
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+        _listener.start()
+        # Drains the queue on exit
+        atexit.register(_listener.stop)
+
+    _listener.handlers[0].setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+    return _listener
@@ -1,28 +1,42 @@
 import os
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import Integer, String, func
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DateTime, Index, Integer, LargeBinary, String, Text, func, text
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 # Removed: cryptography.fernet imports
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize the db object without the app instance
-db = SQLAlchemy()
+# Plain declarative base, so background workers can use these models without Flask.
+# The web app wraps it with Flask-SQLAlchemy (see app.py); table names are explicit.
+class Base(DeclarativeBase):
+    pass
+
+
+# Postgres NOTIFY channel the web app signals on after changing VisaAccount rows
+ACCOUNT_CHANGES_CHANNEL = 'visa_account_changes'
+
+
+def notify_account_change(session):
+    """Queues a NOTIFY for the listener on Postgres (delivered on commit); no-op elsewhere."""
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': ACCOUNT_CHANGES_CHANNEL, 'payload': ''})
 
 # --- CHANGE NOTE 1: Added 'func' import from sqlalchemy ---
 # The 'func' object is necessary to use func.utcnow() for reliable timestamp generation.
 # from sqlalchemy import Integer, String, func 
 # --------------------------------------------------------
 
-class User(db.Model):
+class User(Base):
+    __tablename__ = 'user'
     # This model is kept for consistency but is unused by the application logic
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String, unique=True, nullable=False)
     password: Mapped[str] = mapped_column(String, nullable=False) 
 
-class VisaAccount(db.Model):
+class VisaAccount(Base):
+    __tablename__ = 'visa_account'
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     
     email: Mapped[str] = mapped_column(String, nullable=False)
@@ -36,16 +50,128 @@ class VisaAccount(db.Model):
     target_month_year: Mapped[str] = mapped_column(String, nullable=False) 
     target_day_start: Mapped[int] = mapped_column(Integer, nullable=False) 
     target_day_end: Mapped[int] = mapped_column(Integer, nullable=True) 
+    # Optional Telegram chat that also receives this account's alerts (users, groups or channels)
+    telegram_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
 
     # --- CHANGE NOTE 2: Corrected the default value for last_checked ---
     # The previous definition was prone to throwing a Not Null constraint error
     # because the default function might not have been executed properly 
     # during object creation. func.utcnow() is the idiomatic SQLAlchemy 
     # way to set a creation/update timestamp reliably.
-    last_checked: Mapped[datetime] = mapped_column(db.DateTime, 
+    last_checked: Mapped[datetime] = mapped_column(DateTime, 
                                                  default=func.utcnow(),
                                                  nullable=False)
     # ------------------------------------------------------------------
 
+    # Change feed: set by every write from the web app so the listener can load only
+    # rows changed since its last watermark. Deleting only sets deleted_at (soft delete).
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False,
+                                                 default=datetime.utcnow, index=True)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, nullable=True, index=True)
+
+    # Keyset pagination indexes for the dashboard's sortable/filterable columns
+    __table_args__ = (
+        Index('ix_visa_account_month_id', 'target_month_year', 'id'),
+        Index('ix_visa_account_type_id', 'appointment_type', 'id'),
+        Index('ix_visa_account_checked_id', 'last_checked', 'id'),
+    )
+
     def __repr__(self):
         return f'<VisaAccount {self.unique_id}>'
+
+
+class NotificationOutbox(Base):
+    __tablename__ = 'notification_outbox'
+    # Telegram messages queued by the listener and delivered by the sender process.
+    # status: 'pending' -> 'sending' (claimed by a sender) -> 'sent' or 'failed'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    parse_mode: Mapped[str] = mapped_column(String(16), nullable=False, default='HTML')
+    # Plain-text summary for the live dashboard, built without account details (names,
+    # IDs, emails); NULL for messages that only concern accounts
+    preview: Mapped[str] = mapped_column(Text, nullable=True)
+
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default='pending')
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    claim_token: Mapped[str] = mapped_column(String(32), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    # Earliest time a sender may (re)try this row; pushed back after failures
+    available_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    sent_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_notification_outbox_status_available', 'status', 'available_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} {self.status}>'
+
+
+
+class NotificationState(Base):
+    __tablename__ = 'notification_state'
+    # Last slot set each alert key ('location:<name>' or 'account:<id>') was notified about,
+    # stored as a little-endian day-ordinal bitmap so restarts do not re-alert.
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    base_ordinal: Mapped[int] = mapped_column(Integer, nullable=False)
+    bitmap: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NotificationState {self.key}>'
+
+
+class ListenerWorker(Base):
+    __tablename__ = 'listener_worker'
+    # One row per running listener process; a worker counts as live while its heartbeat is fresh
+    worker_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ListenerWorker {self.worker_id}>'
+
+
+class ListenerLease(Base):
+    __tablename__ = 'listener_lease'
+    # Ownership of one account shard (VisaAccount.id % shard count) by a listener worker
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    owner: Mapped[str] = mapped_column(String(128), nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ListenerLease {self.shard} {self.owner}>'
+
+class ListenerCycle(Base):
+    __tablename__ = 'listener_cycle'
+    # Latest cycle summary of each listener process (JSON), streamed to open dashboards
+    worker_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+
+    def __repr__(self):
+        return f'<ListenerCycle {self.worker_id} {self.finished_at}>'
+
+
+class SlotHistory(Base):
+    __tablename__ = 'slot_history'
+    # Append-only log of a location's schedule: one row per observed change, holding the
+    # days that opened and closed as bitmaps starting at base_ordinal. Every few rows also
+    # carry the full schedule (snapshot), so replaying to any point reads a bounded number of rows.
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    location: Mapped[str] = mapped_column(String(255), nullable=False)
+    recorded_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    base_ordinal: Mapped[int] = mapped_column(Integer, nullable=False)
+    added: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    removed: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    snapshot: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+
+    __table_args__ = (
+        Index('ix_slot_history_location_recorded', 'location', 'recorded_at'),
+    )
+
+    def __repr__(self):
+        return f'<SlotHistory {self.location} {self.recorded_at}>'
@@ -0,0 +1,158 @@
+import datetime
+import html
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Telegram rejects messages longer than this
+TELEGRAM_MAX_LENGTH = 4096
+# Room kept in every header for its part number, e.g. ' (12/15)'
+PART_SUFFIX_RESERVE = 10
+# Slots listed per account and direction; the rest are only counted
+MAX_ACCOUNT_SLOTS = 5
+
+
+@lru_cache(maxsize=2048)
+def format_slot(slot: datetime.date) -> str:
+    """'2026-03-02 (Monday)'; the same few hundred dates recur every cycle, so they are formatted once."""
+    return f"{slot.strftime('%Y-%m-%d')} ({slot.strftime('%A')})"
+
+
+def location_section(month_name: str, added: Sequence[datetime.date], removed: Sequence[datetime.date],
+                     location: Optional[str] = None) -> str:
+    """One month's slot changes at a location; `location` names it in the heading (digest mode)."""
+    heading = f"{location} · {month_name}" if location else month_name
+    lines = [f"<b>{html.escape(heading)}:</b>\n"]
+    lines.extend(f"  ✅ <b>{format_slot(slot)}</b> ← NEW!\n" for slot in added)
+    lines.extend(f"  ❌ <s>{format_slot(slot)}</s> ← GONE\n" for slot in removed)
+    return ''.join(lines)
+
+
+def location_preview(month_name: str, added: Sequence[datetime.date], removed: Sequence[datetime.date],
+                     location: str) -> str:
+    """Plain-text one-liner of a location section, for the dashboard (no markup, nothing about accounts)."""
+    parts = []
+    if added:
+        parts.append(f"{len(added)} new, earliest {format_slot(added[0])}")
+    if removed:
+        parts.append(f"{len(removed)} gone")
+    return f"{location} · {month_name}: {', '.join(parts)}"
+
+
+def account_section(name: str, unique_id: str, email: str, target: str, added: Sequence[datetime.date],
+                    removed: Sequence[datetime.date], open_slots: Sequence[datetime.date]) -> str:
+    """
+    One account's matching slot changes, ending with what to do about them.
+    Account fields are user input and are escaped for Telegram's HTML mode:
+    one stray '<' would get the whole (digest) message rejected.
+    """
+    lines = [
+        f"<b>Name:</b> {html.escape(name)}\n",
+        f"<b>ID:</b> <code>{html.escape(unique_id)}</code>\n",
+        f"<b>Target:</b> {html.escape(target)}\n\n",
+    ]
+    if added:
+        lines.append("<b>New Slots:</b>\n")
+        lines.extend(f"  ✅ <b>{format_slot(slot)}</b>\n" for slot in added[:MAX_ACCOUNT_SLOTS])
+    if removed:
+        lines.append("<b>Gone:</b>\n")
+        lines.extend(f"  ❌ <s>{format_slot(slot)}</s>\n" for slot in removed[:MAX_ACCOUNT_SLOTS])
+    if open_slots:
+        lines.append(f"\n<b>Still open:</b> {len(open_slots)} slot(s), earliest {format_slot(open_slots[0])}\n")
+    if added:
+        lines.append(f"\n<b>ACTION REQUIRED:</b> Log in with email <code>{html.escape(email)}</code> to reschedule!")
+    return ''.join(lines)
+
+
+def _pieces(section: str, budget: int) -> Iterator[str]:
+    """The section itself, or line-aligned chunks of it when it alone is over budget."""
+    if len(section) <= budget:
+        yield section
+        return
+    chunk = ''
+    for line in section.splitlines(keepends=True):
+        while len(line) > budget:
+            # A single line this long only comes from malformed data; cut it anywhere
+            if chunk:
+                yield chunk
+                chunk = ''
+            yield line[:budget]
+            line = line[budget:]
+        if len(chunk) + len(line) > budget:
+            yield chunk
+            chunk = ''
+        chunk += line
+    if chunk:
+        yield chunk
+
+
+def pack_messages(title: str, sections: Iterable[str], limit: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+    """
+    Packs sections into as few messages of at most `limit` characters as
+    possible, in order, each starting with `title` (numbered when there is
+    more than one part). Sections are only cut, at line breaks, when one
+    does not fit in a message by itself.
+    """
+    # Sections are separated by a blank line
+    budget = limit - len(title) - PART_SUFFIX_RESERVE - len('\n\n')
+    bodies: List[List[str]] = [[]]
+    size = 0
+    for section in sections:
+        for piece in _pieces(section.rstrip('\n') + '\n', budget):
+            if bodies[-1] and size + 1 + len(piece) > budget:
+                bodies.append([])
+                size = 0
+            size += len(piece) + (1 if bodies[-1] else 0)
+            bodies[-1].append(piece)
+    if not bodies[0]:
+        return []
+    total = len(bodies)
+    return [
+        f"{title}{f' ({number}/{total})' if total > 1 else ''}\n\n" + '\n'.join(body)
+        for number, body in enumerate(bodies, 1)
+    ]
+
+
+class CycleDigest:
+    """
+    The alerts of one listener cycle, grouped per chat and rendered into as
+    few messages as Telegram's length limit allows: a cycle that would send
+    a message per changed month and per matched account sends one or two.
+    """
+
+    def __init__(self):
+        # chat id -> (section, whether it reports new slots, dashboard preview), in the order found
+        self._sections: Dict[int, List[Tuple[str, bool, Optional[str]]]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._sections)
+
+    def add(self, chat_ids: Iterable[int], section: str, new_slots: bool, preview: Optional[str] = None):
+        """`preview` is the section's dashboard summary; account sections have none."""
+        for chat_id in chat_ids:
+            self._sections.setdefault(chat_id, []).append((section, new_slots, preview))
+
+    def render(self) -> List[Tuple[int, str, Optional[str]]]:
+        """
+        (chat id, message, dashboard preview) for everything added so far; the
+        digest is empty afterwards. A chat's first message carries the preview:
+        its location summaries and the number of account alerts, if it has any
+        location sections at all.
+        """
+        messages = []
+        for chat_id, sections in self._sections.items():
+            # Sections with new slots first: they are what someone has to act on
+            ordered = sorted(sections, key=lambda entry: not entry[1])
+            found = sum(1 for _, new_slots, _ in sections if new_slots)
+            previews = [preview for _, _, preview in ordered if preview]
+            summary = None
+            if previews:
+                summary = '\n'.join([f"Digest: {len(previews)} location update(s), "
+                                      f"{len(sections) - len(previews)} account alert(s)"] + previews)
+            if found:
+                title = f"<b>🚨 NEW VISA SLOTS FOUND! 🚨</b> {found} alert(s), {len(sections) - found} update(s)"
+            else:
+                title = f"<b>⚠️ Visa Slots No Longer Available</b> {len(sections)} update(s)"
+            texts = pack_messages(title, (section for section, _, _ in ordered))
+            messages.extend((chat_id, text, summary if number == 0 else None) for number, text in enumerate(texts))
+        self._sections = {}
+        return messages
@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from typing import TYPE_CHECKING, List, Tuple
+
+from sqlalchemy import case, delete, or_, select, update
+
+from database import run_db, session_scope
+from metrics import REGISTRY
+from models import NotificationOutbox
+
+if TYPE_CHECKING:
+    # python-telegram-bot is heavy to import; run_sender.py loads it when building the dispatcher
+    from telegram_dispatcher import TelegramDispatcher
+
+# A 'sending' row older than this is assumed orphaned by a crashed sender
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+# How long a row whose delivery failed (after the dispatcher's own retries) waits
+RETRY_DELAY = datetime.timedelta(minutes=1)
+
+DB_SECONDS = REGISTRY.histogram('sender_db_seconds', 'Time spent in outbox database work.', ['operation'])
+ROWS_CLAIMED = REGISTRY.counter('sender_rows_claimed_total', 'Outbox rows claimed for delivery.')
+ROWS_FAILED = REGISTRY.counter('sender_rows_failed_total', 'Outbox rows whose delivery failed (retried or not).')
+
+
+class NotificationSender:
+    """
+    Drains the notification outbox in batches and delivers it to Telegram.
+
+    On Postgres a batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+    several senders can run side by side. On SQLite (single writer) rows are
+    claimed by stamping a claim token in one UPDATE and reading them back.
+    Failed rows are retried after RETRY_DELAY until `max_attempts`, then marked failed.
+    Database work runs on the database threads (run_db), never on the event loop
+    that the dispatcher's sends are in flight on.
+    """
+
+    def __init__(
+        self,
+        dispatcher: 'TelegramDispatcher',
+        batch_size: int = 50,
+        poll_interval_seconds: float = 2.0,
+        max_attempts: int = 5,
+        retention_days: int = 7,
+    ):
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retention = datetime.timedelta(days=retention_days)
+        self.last_prune = None
+
+    def _claimable(self, now: datetime.datetime):
+        return or_(
+            (NotificationOutbox.status == 'pending') & (NotificationOutbox.available_at <= now),
+            (NotificationOutbox.status == 'sending') & (NotificationOutbox.claimed_at < now - CLAIM_TIMEOUT),
+        )
+
+    def _claim_batch(self) -> List[Tuple[int, int, str, str]]:
+        """Claims up to batch_size deliverable rows and returns (id, chat_id, text, parse_mode)."""
+        now = datetime.datetime.utcnow()
+        token = uuid.uuid4().hex
+        columns = (NotificationOutbox.id, NotificationOutbox.chat_id,
+                   NotificationOutbox.text, NotificationOutbox.parse_mode)
+
+        with DB_SECONDS.labels('claim').time(), session_scope() as session:
+            try:
+                if session.get_bind().dialect.name == 'postgresql':
+                    rows = session.execute(
+                        select(*columns)
+                        .where(self._claimable(now))
+                        .order_by(NotificationOutbox.id)
+                        .limit(self.batch_size)
+                        .with_for_update(skip_locked=True)
+                    ).all()
+                    if rows:
+                        session.execute(
+                            update(NotificationOutbox)
+                            .where(NotificationOutbox.id.in_([row.id for row in rows]))
+                            .values(status='sending', claim_token=token, claimed_at=now)
+                        )
+                else:
+                    # Polling fallback: the claim is a single atomic UPDATE on SQLite
+                    candidate_ids = (
+                        select(NotificationOutbox.id)
+                        .where(self._claimable(now))
+                        .order_by(NotificationOutbox.id)
+                        .limit(self.batch_size)
+                        .scalar_subquery()
+                    )
+                    session.execute(
+                        update(NotificationOutbox)
+                        .where(NotificationOutbox.id.in_(candidate_ids))
+                        .values(status='sending', claim_token=token, claimed_at=now)
+                        .execution_options(synchronize_session=False)
+                    )
+                    rows = session.execute(
+                        select(*columns)
+                        .where(NotificationOutbox.claim_token == token)
+                        .order_by(NotificationOutbox.id)
+                    ).all()
+                session.commit()
+                return [tuple(row) for row in rows]
+            except Exception as e:
+                session.rollback()
+                logging.critical(f"CRITICAL ERROR: Failed to claim outbox batch: {e}")
+                return []
+
+    def _record_results(self, results: List[Tuple[int, bool]]):
+        """Marks delivered rows sent and reschedules (or fails) the rest."""
+        now = datetime.datetime.utcnow()
+        sent_ids = [row_id for row_id, ok in results if ok]
+        failed_ids = [row_id for row_id, ok in results if not ok]
+        ROWS_FAILED.inc(len(failed_ids))
+
+        with DB_SECONDS.labels('record_results').time(), session_scope() as session:
+            try:
+                if sent_ids:
+                    session.execute(
+                        update(NotificationOutbox)
+                        .where(NotificationOutbox.id.in_(sent_ids))
+                        .values(status='sent', sent_at=now, claim_token=None)
+                    )
+                if failed_ids:
+                    attempts = NotificationOutbox.attempts + 1
+                    session.execute(
+                        update(NotificationOutbox)
+                        .where(NotificationOutbox.id.in_(failed_ids))
+                        .values(
+                            status=case((attempts >= self.max_attempts, 'failed'), else_='pending'),
+                            attempts=attempts,
+                            claim_token=None,
+                            available_at=now + RETRY_DELAY,
+                        )
+                    )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logging.critical(f"CRITICAL ERROR: Failed to record outbox results: {e}")
+
+    def _prune(self):
+        """Deletes delivered rows past the retention window, at most once an hour."""
+        now = datetime.datetime.utcnow()
+        if self.last_prune and now - self.last_prune < datetime.timedelta(hours=1):
+            return
+        self.last_prune = now
+
+        with DB_SECONDS.labels('prune').time(), session_scope() as session:
+            try:
+                session.execute(
+                    delete(NotificationOutbox)
+                    .where(NotificationOutbox.status == 'sent')
+                    .where(NotificationOutbox.sent_at < now - self.retention)
+                )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logging.error(f"Failed to prune outbox: {e}")
+
+    async def _deliver(self, row: Tuple[int, int, str, str]) -> Tuple[int, bool]:
+        row_id, chat_id, text, parse_mode = row
+        return row_id, await self.dispatcher.deliver(chat_id, text, parse_mode=parse_mode)
+
+    async def drain_once(self) -> int:
+        """Claims and delivers one batch. Returns the number of rows claimed."""
+        batch = await run_db(self._claim_batch)
+        ROWS_CLAIMED.inc(len(batch))
+        if batch:
+            results = await asyncio.gather(*(self._deliver(row) for row in batch))
+            await run_db(self._record_results, results)
+        return len(batch)
+
+    async def run_async(self):
+        logging.info(f"Starting notification sender → batches of {self.batch_size}, "
+                     f"polling every {self.poll_interval}s when idle")
+
+        while True:
+            claimed = await self.drain_once()
+            if claimed:
+                logging.info(f"Outbox batch done: {claimed} claimed, "
+                             f"{self.dispatcher.sent} sent / {self.dispatcher.dropped} failed in total.")
+            else:
+                await run_db(self._prune)
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,154 @@
+import datetime
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import NotificationState
+from slot_index import bitmap_from_bytes, bitmap_to_bytes
+
+ACCOUNT_PREFIX = 'account:'
+LOCATION_PREFIX = 'location:'
+# Month-check state from before locations were keyed separately
+LEGACY_GLOBAL_KEY = 'global'
+# NotificationState.key is a String(64)
+MAX_KEY_LENGTH = 64
+
+# Dialects with INSERT ... ON CONFLICT; others fall back to UPDATE/INSERT by what was loaded
+_UPSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+
+def account_key(account_id: int) -> str:
+    return f'{ACCOUNT_PREFIX}{account_id}'
+
+
+def location_key(location: str) -> str:
+    """Key of a location's month-check state; overlong names are replaced by their digest."""
+    key = f'{LOCATION_PREFIX}{location}'
+    if len(key) > MAX_KEY_LENGTH:
+        key = f'{LOCATION_PREFIX}{hashlib.sha1(location.encode()).hexdigest()}'
+    return key
+
+
+def key_account_id(key: str) -> Optional[int]:
+    """The account id behind an account key, or None for non-account keys."""
+    return int(key[len(ACCOUNT_PREFIX):]) if key.startswith(ACCOUNT_PREFIX) else None
+
+
+class NotifiedSlots:
+    """
+    The slot set last notified for every alert key, as day-ordinal bitmaps.
+
+    Loaded once, diffed in memory with bitwise operations, and written back
+    only for the keys that changed. Callers own the session and transaction:
+    write() stages the changes and mark_clean() is called after the commit.
+    """
+
+    def __init__(self, base_ordinal: int):
+        self.base_ordinal = base_ordinal
+        self._bits: Dict[str, int] = {}
+        self._persisted: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._forgotten: Set[str] = set()
+
+    def load(self, session, keep: Optional[Callable[[str], bool]] = None,
+             since: Optional[datetime.datetime] = None):
+        """
+        Reads the stored bitmaps, re-based onto this listener's base ordinal.
+        `keep` restricts loading to the keys this listener is responsible for,
+        `since` to rows written after that time.
+        """
+        query = select(NotificationState.key, NotificationState.base_ordinal, NotificationState.bitmap)
+        if since is not None:
+            query = query.where(NotificationState.updated_at > since)
+        rows = session.execute(query).all()
+        for key, base, data in rows:
+            if keep is not None and not keep(key):
+                continue
+            bits = bitmap_from_bytes(data)
+            shift = base - self.base_ordinal
+            # Days before our base can no longer be offered, so they are simply dropped
+            self._bits[key] = bits << shift if shift >= 0 else bits >> -shift
+            self._persisted.add(key)
+
+    def restore(self, bitmaps: Dict[str, int]):
+        """Adopts bitmaps known to match the stored rows (e.g. from a snapshot)."""
+        self._bits.update(bitmaps)
+        self._persisted.update(bitmaps)
+
+    def bitmaps(self) -> Dict[str, int]:
+        return dict(self._bits)
+
+    def get(self, key: str) -> int:
+        return self._bits.get(key, 0)
+
+    def keys(self) -> List[str]:
+        return list(self._bits)
+
+    def account_ids(self) -> List[int]:
+        """Accounts whose last notification still listed at least one slot."""
+        return [key_account_id(key) for key, bits in self._bits.items()
+                if bits and key.startswith(ACCOUNT_PREFIX)]
+
+    def update(self, key: str, bits: int, mask: int = -1) -> Tuple[int, int]:
+        """
+        Replaces the part of `key`'s bitmap selected by `mask` with `bits`.
+        Returns (added, removed) bitmaps; both are 0 when nothing changed.
+        """
+        previous = self._bits.get(key, 0)
+        bits &= mask
+        added = bits & ~previous
+        removed = previous & mask & ~bits
+        if added or removed:
+            self._bits[key] = (previous & ~mask) | bits
+            self._dirty.add(key)
+            self._forgotten.discard(key)
+        return added, removed
+
+    def forget(self, keys: Iterable[str]):
+        for key in keys:
+            if self._bits.pop(key, None) is not None:
+                self._dirty.discard(key)
+                # Deleted even if never loaded: a failed load leaves stored rows unknown
+                self._forgotten.add(key)
+
+    def has_changes(self) -> bool:
+        return bool(self._dirty or self._forgotten)
+
+    def write(self, session):
+        """
+        Stages changed bitmaps as one bulk upsert (or UPDATE plus INSERT where
+        the database has no ON CONFLICT) and one DELETE. The upsert does not
+        depend on what load() saw: after a failed load, or when another worker
+        wrote a key during a shard handover, a row may exist that this object
+        does not know about.
+        """
+        now = datetime.datetime.utcnow()
+        rows = [{'key': key, 'base_ordinal': self.base_ordinal,
+                 'bitmap': bitmap_to_bytes(self._bits[key]), 'updated_at': now}
+                for key in self._dirty]
+
+        upsert = _UPSERTS.get(session.get_bind().dialect.name)
+        if rows and upsert is not None:
+            statement = upsert(NotificationState.__table__)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=['key'],
+                set_={field: statement.excluded[field] for field in ('base_ordinal', 'bitmap', 'updated_at')},
+            ), rows)
+        elif rows:
+            existing = [row for row in rows if row['key'] in self._persisted]
+            new = [row for row in rows if row['key'] not in self._persisted]
+            if existing:
+                session.execute(update(NotificationState), existing)
+            if new:
+                session.execute(insert(NotificationState), new)
+        if self._forgotten:
+            session.execute(delete(NotificationState).where(NotificationState.key.in_(list(self._forgotten))))
+
+    def mark_clean(self):
+        self._persisted |= self._dirty
+        self._persisted -= self._forgotten
+        self._dirty.clear()
+        self._forgotten.clear()
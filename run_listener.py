@@ -1,5 +1,6 @@
 # run_listener.py
 from visa_listener import VisaSlotListener
+from slot_sources import sources_from_file
 import os
 from dotenv import load_dotenv
 import asyncio
@@ -7,10 +8,20 @@ import asyncio
 load_dotenv()
 
 listener = VisaSlotListener(
-    telegram_token=os.getenv("TELEGRAM_TOKEN"),
     telegram_chat_id=int(os.getenv("TELEGRAM_CHAT_ID")),
     poll_interval_seconds=60,
-    location="Accra U.S. Embassy/Consulate"
+    location="Accra U.S. Embassy/Consulate",
+    # Set LISTENER_SHARDS (e.g. 32) on every worker to split accounts between processes
+    shard_count=int(os.getenv("LISTENER_SHARDS", "0")) or None,
+    worker_id=os.getenv("LISTENER_WORKER_ID"),
+    # Optional {location: rules} JSON file; edits are picked up without a restart
+    sources=sources_from_file(os.environ["LISTENER_RULES_FILE"]) if os.getenv("LISTENER_RULES_FILE") else None,
+    # Serves /metrics on this port when set
+    metrics_port=int(os.getenv("LISTENER_METRICS_PORT", "0")) or None,
+    # LISTENER_DIGEST=1 groups each cycle's alerts into as few messages as fit
+    digest=os.getenv("LISTENER_DIGEST", "").lower() in ("1", "true", "yes"),
+    # Warm-restart snapshot file on a persistent disk (single-process mode)
+    snapshot_path=os.getenv("LISTENER_SNAPSHOT_PATH")
 )
 
 
@@ -0,0 +1,37 @@
+# run_sender.py
+from notification_sender import NotificationSender
+from telegram_dispatcher import TelegramDispatcher
+from metrics import serve_metrics
+from logging_config import setup_logging
+import os
+from dotenv import load_dotenv
+import asyncio
+import telegram
+from telegram.request import HTTPXRequest
+
+load_dotenv()
+setup_logging()
+
+# The bot's HTTP connection pool must fit the dispatcher's concurrency
+CONCURRENCY = 8
+
+bot = telegram.Bot(
+    token=os.getenv("TELEGRAM_TOKEN"),
+    request=HTTPXRequest(connection_pool_size=CONCURRENCY)
+)
+
+sender = NotificationSender(
+    dispatcher=TelegramDispatcher(bot, max_concurrency=CONCURRENCY),
+    batch_size=50,
+    poll_interval_seconds=2
+)
+
+
+async def main():
+    # Optional /metrics endpoint for this process
+    if os.getenv("SENDER_METRICS_PORT"):
+        await serve_metrics(int(os.getenv("SENDER_METRICS_PORT")))
+    await sender.run_async()
+
+
+asyncio.run(main())
@@ -0,0 +1,105 @@
+import datetime
+import logging
+import os
+import socket
+import uuid
+from typing import FrozenSet
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import ListenerLease, ListenerWorker
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class ShardLeaseManager:
+    """
+    Splits accounts into `shard_count` shards (VisaAccount.id % shard_count)
+    and leases them to live listener workers.
+
+    Every heartbeat a worker refreshes its presence row, works out which
+    shards it should own (shard % live workers == its rank among them),
+    releases the rest, renews what it holds and claims wanted shards whose
+    lease is free or expired. A crashed worker stops heartbeating, so its
+    shards are re-assigned and picked up once its leases expire.
+    """
+
+    def __init__(self, shard_count: int, worker_id: str, lease_seconds: float = 60):
+        self.shard_count = shard_count
+        self.worker_id = worker_id
+        self.ttl = datetime.timedelta(seconds=lease_seconds)
+        self._rows_ready = False
+
+    def _ensure_lease_rows(self, session):
+        """Creates the shard rows once; concurrent workers racing here is harmless."""
+        existing = set(session.execute(select(ListenerLease.shard)).scalars())
+        missing = [{'shard': shard, 'owner': None, 'expires_at': datetime.datetime.utcnow()}
+                   for shard in range(self.shard_count) if shard not in existing]
+        if missing:
+            try:
+                session.execute(insert(ListenerLease), missing)
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+        self._rows_ready = True
+
+    def heartbeat(self, session) -> FrozenSet[int]:
+        """Renews presence and leases, commits, and returns the shards currently owned."""
+        if not self._rows_ready:
+            self._ensure_lease_rows(session)
+
+        now = datetime.datetime.utcnow()
+        expires_at = now + self.ttl
+
+        touched = session.execute(
+            update(ListenerWorker)
+            .where(ListenerWorker.worker_id == self.worker_id)
+            .values(heartbeat_at=now)
+        ).rowcount
+        if not touched:
+            session.execute(insert(ListenerWorker).values(worker_id=self.worker_id, heartbeat_at=now))
+
+        live = list(session.execute(
+            select(ListenerWorker.worker_id)
+            .where(ListenerWorker.heartbeat_at > now - self.ttl)
+            .order_by(ListenerWorker.worker_id)
+        ).scalars())
+        rank = live.index(self.worker_id)
+        wanted = [shard for shard in range(self.shard_count) if shard % len(live) == rank]
+
+        # Hand back shards that now belong to someone else
+        session.execute(
+            update(ListenerLease)
+            .where(ListenerLease.owner == self.worker_id)
+            .where(ListenerLease.shard.not_in(wanted))
+            .values(owner=None, expires_at=now)
+        )
+        # Renew what we hold and take over wanted shards that are free or expired
+        session.execute(
+            update(ListenerLease)
+            .where(ListenerLease.shard.in_(wanted))
+            .where(or_(
+                ListenerLease.owner == self.worker_id,
+                ListenerLease.owner.is_(None),
+                ListenerLease.expires_at <= now,
+            ))
+            .values(owner=self.worker_id, expires_at=expires_at)
+        )
+        # Forget workers that have been gone for a long time
+        session.execute(
+            delete(ListenerWorker).where(ListenerWorker.heartbeat_at < now - 10 * self.ttl)
+        )
+
+        owned = frozenset(session.execute(
+            select(ListenerLease.shard)
+            .where(and_(ListenerLease.owner == self.worker_id, ListenerLease.expires_at > now))
+        ).scalars())
+        session.commit()
+
+        if len(owned) < len(wanted):
+            logging.info(f"Holding {len(owned)}/{len(wanted)} wanted shard(s); "
+                         f"waiting for {len(live)} live worker(s) to hand over the rest.")
+        return owned
@@ -0,0 +1,197 @@
+import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from models import SlotHistory
+from slot_index import bitmap_from_bytes, bitmap_to_bytes, from_bitmap
+from slot_sources import DEFAULT_LOCATION
+
+# In-memory schedule bitmaps start here; earlier days are never recorded
+EPOCH_ORDINAL = datetime.date(2020, 1, 1).toordinal()
+# Every SNAPSHOT_EVERY-th row of a location also stores its full schedule
+SNAPSHOT_EVERY = 32
+# Query defaults and limits
+DEFAULT_QUERY_DAYS = 30
+DEFAULT_SLOT_DAYS = 366
+MAX_SLOT_DAYS = 731
+
+
+def _encode(bitmaps: List[int], base: int) -> Tuple[int, List[bytes]]:
+    """Re-bases bitmaps onto their lowest set day, so a row only holds the days it covers."""
+    low = min(((bits & -bits).bit_length() - 1 for bits in bitmaps if bits), default=0)
+    return base + low, [bitmap_to_bytes(bits >> low) for bits in bitmaps]
+
+
+def _decode(data: bytes, row_base: int, base: int) -> int:
+    bits = bitmap_from_bytes(data)
+    shift = row_base - base
+    # Days before `base` are dropped
+    return bits << shift if shift >= 0 else bits >> -shift
+
+
+def _replay(session, location: str, base: int, mask: int = -1,
+            until: Optional[datetime.datetime] = None) -> Tuple[Optional[int], int, int]:
+    """
+    The location's schedule as recorded at `until` (default: now), from the
+    latest snapshot before it plus the changes after that snapshot.
+    Returns (id of the last row read, schedule bitmap, changes since the snapshot).
+    """
+    snapshot_query = select(SlotHistory.id, SlotHistory.recorded_at).where(
+        SlotHistory.location == location, SlotHistory.snapshot.is_not(None)
+    )
+    query = select(SlotHistory).where(SlotHistory.location == location)
+    if until is not None:
+        snapshot_query = snapshot_query.where(SlotHistory.recorded_at <= until)
+        query = query.where(SlotHistory.recorded_at <= until)
+    snapshot = session.execute(
+        snapshot_query.order_by(SlotHistory.recorded_at.desc(), SlotHistory.id.desc()).limit(1)
+    ).first()
+    if snapshot is not None:
+        query = query.where(SlotHistory.recorded_at >= snapshot.recorded_at)
+
+    head, bits, since_snapshot = None, 0, 0
+    started = snapshot is None
+    for row in session.scalars(query.order_by(SlotHistory.recorded_at, SlotHistory.id)):
+        if not started:
+            # Rows stamped in the same instant as the snapshot, but written before it
+            if row.id != snapshot.id:
+                continue
+            started = True
+        if row.snapshot is not None:
+            bits, since_snapshot = _decode(row.snapshot, row.base_ordinal, base) & mask, 0
+        else:
+            removed = _decode(row.removed, row.base_ordinal, base)
+            bits = (bits & ~removed | _decode(row.added, row.base_ordinal, base)) & mask
+            since_snapshot += 1
+        head = row.id
+    return head, bits, since_snapshot
+
+
+class HistoryWriter:
+    """
+    Appends a location's schedule to slot_history, as the days opened and
+    closed since the last recorded schedule, and only when it changed.
+
+    The last recorded schedule is kept in memory and replayed from the table
+    only when another listener (a previous owner of shard 0) appended since.
+    """
+
+    def __init__(self):
+        # location -> (id of its last row, schedule bitmap from EPOCH_ORDINAL, changes since the last snapshot)
+        self._last: Dict[str, Tuple[Optional[int], int, int]] = {}
+
+    def record(self, session, location: str, slots: Iterable[datetime.date],
+               recorded_at: Optional[datetime.datetime] = None) -> bool:
+        """Stages a row if the schedule differs from the last recorded one. The caller commits."""
+        bits = 0
+        for slot in slots:
+            day = slot.toordinal() - EPOCH_ORDINAL
+            if day >= 0:
+                bits |= 1 << day
+
+        head = session.scalar(
+            select(SlotHistory.id).where(SlotHistory.location == location)
+            .order_by(SlotHistory.recorded_at.desc(), SlotHistory.id.desc()).limit(1)
+        )
+        last = self._last.get(location)
+        if last is None or last[0] != head:
+            last = _replay(session, location, EPOCH_ORDINAL)
+        _, previous, since_snapshot = last
+
+        added, removed = bits & ~previous, previous & ~bits
+        if not added and not removed:
+            self._last[location] = last
+            return False
+        take_snapshot = head is None or since_snapshot + 1 >= SNAPSHOT_EVERY
+        base, (added_data, removed_data, snapshot_data) = _encode(
+            [added, removed, bits if take_snapshot else 0], EPOCH_ORDINAL
+        )
+        row_id = session.execute(insert(SlotHistory).values(
+            location=location, recorded_at=recorded_at or datetime.datetime.utcnow(), base_ordinal=base,
+            added=added_data, removed=removed_data, snapshot=snapshot_data if take_snapshot else None,
+        ).returning(SlotHistory.id)).scalar_one()
+        # If the transaction is rolled back, the head check replays on the next call
+        self._last[location] = (row_id, bits, 0 if take_snapshot else since_snapshot + 1)
+        return True
+
+
+def _utc(value: datetime.datetime) -> datetime.datetime:
+    # Stored timestamps are naive UTC
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+def _isoformat(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.isoformat() + 'Z' if value else None
+
+
+def parse_query(args: Mapping[str, str]) -> Dict:
+    """
+    Query parameters of the history API: location, since/until (ISO
+    timestamps, default the last DEFAULT_QUERY_DAYS days) and first_day/
+    last_day (the slot dates of interest). Raises ValueError if malformed.
+    """
+    until = _utc(datetime.datetime.fromisoformat(args['until'])) if args.get('until') \
+        else datetime.datetime.utcnow()
+    since = _utc(datetime.datetime.fromisoformat(args['since'])) if args.get('since') \
+        else until - datetime.timedelta(days=DEFAULT_QUERY_DAYS)
+    first_day = datetime.date.fromisoformat(args['first_day']) if args.get('first_day') else since.date()
+    last_day = datetime.date.fromisoformat(args['last_day']) if args.get('last_day') \
+        else first_day + datetime.timedelta(days=DEFAULT_SLOT_DAYS - 1)
+    if since >= until:
+        raise ValueError('since must be before until')
+    if not 0 <= (last_day - first_day).days < MAX_SLOT_DAYS:
+        raise ValueError(f'first_day..last_day must be ordered and span at most {MAX_SLOT_DAYS} days')
+    return {'location': args.get('location') or DEFAULT_LOCATION, 'since': since, 'until': until,
+            'first_day': first_day, 'last_day': last_day}
+
+
+def availability(session, location: str, since: datetime.datetime, until: datetime.datetime,
+                 first_day: datetime.date, last_day: datetime.date) -> Dict:
+    """
+    When each slot date in first_day..last_day was open between `since` and
+    `until`, as [opened, closed] intervals; None means open before `since` or
+    still open at `until`. Reads the latest snapshot before `since`, the rows
+    after it, and the rows in the range: cost follows the number of changes.
+    """
+    base = first_day.toordinal()
+    mask = (1 << (last_day.toordinal() - base + 1)) - 1
+    _, state, _ = _replay(session, location, base, mask, until=since)
+
+    open_since: Dict[datetime.date, Optional[datetime.datetime]] = {day: None for day in from_bitmap(state, base)}
+    intervals: Dict[datetime.date, List[Tuple]] = {}
+    changes = 0
+    rows = session.execute(
+        select(SlotHistory.recorded_at, SlotHistory.base_ordinal, SlotHistory.added, SlotHistory.removed)
+        .where(SlotHistory.location == location, SlotHistory.recorded_at > since,
+               SlotHistory.recorded_at <= until)
+        .order_by(SlotHistory.recorded_at, SlotHistory.id)
+    )
+    for recorded_at, row_base, added_data, removed_data in rows:
+        added = _decode(added_data, row_base, base) & mask & ~state
+        removed = _decode(removed_data, row_base, base) & state
+        if not added and not removed:
+            continue
+        changes += 1
+        for day in from_bitmap(added, base):
+            open_since[day] = recorded_at
+        for day in from_bitmap(removed, base):
+            intervals.setdefault(day, []).append((open_since.pop(day), recorded_at))
+        state = state & ~removed | added
+    for day, opened in open_since.items():
+        intervals.setdefault(day, []).append((opened, None))
+
+    return {
+        'location': location,
+        'since': _isoformat(since),
+        'until': _isoformat(until),
+        'first_day': first_day.isoformat(),
+        'last_day': last_day.isoformat(),
+        'changes': changes,
+        'open_at_until': state.bit_count(),
+        'slots': [
+            {'date': day.isoformat(), 'open': [[_isoformat(opened), _isoformat(closed)]
+                                               for opened, closed in intervals[day]]}
+            for day in sorted(intervals)
+        ],
+    }
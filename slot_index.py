@@ -0,0 +1,98 @@
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from typing import Dict, Iterable, List, Tuple
+
+
+# --- Day-ordinal bitmaps ---
+# A slot set is encoded as a Python int where bit i means date.fromordinal(base + i),
+# so set differences are single bitwise operations. Days before `base` cannot be
+# represented and are left out.
+
+def to_bitmap(slots: Iterable[datetime.date], base: int) -> int:
+    bits = 0
+    for slot in slots:
+        day = slot.toordinal() - base
+        if day >= 0:
+            bits |= 1 << day
+    return bits
+
+
+def from_bitmap(bits: int, base: int) -> List[datetime.date]:
+    """Decodes a bitmap into its dates, in order."""
+    slots = []
+    while bits:
+        low = bits & -bits
+        slots.append(datetime.date.fromordinal(base + low.bit_length() - 1))
+        bits ^= low
+    return slots
+
+
+def month_mask(year: int, month: int, base: int) -> int:
+    """Bitmap with every day of the given month set."""
+    first = datetime.date(year, month, 1).toordinal() - base
+    days = monthrange(year, month)[1]
+    return ((1 << days) - 1) << first if first >= 0 else ((1 << days) - 1) >> -first
+
+
+def bitmap_to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def bitmap_from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, 'little')
+
+
+class SlotIndex:
+    """
+    Sorted day-ordinal index over the slot schedule.
+
+    Built once from the full schedule. The position of a slot in the sorted
+    array doubles as its prefix count, so "slots before D" is a single bisect
+    and "slots in month M" is a lookup into the per-month offsets.
+    """
+
+    def __init__(self, slots: Iterable[datetime.date]):
+        self._ordinals = array('i', sorted({slot.toordinal() for slot in slots}))
+
+        # (year, month) -> (lo, hi) half-open offsets into self._ordinals
+        self._month_offsets: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        for position, ordinal in enumerate(self._ordinals):
+            day = datetime.date.fromordinal(ordinal)
+            key = (day.year, day.month)
+            lo, _ = self._month_offsets.get(key, (position, position))
+            self._month_offsets[key] = (lo, position + 1)
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def __contains__(self, slot: datetime.date) -> bool:
+        ordinal = slot.toordinal()
+        position = bisect_left(self._ordinals, ordinal)
+        return position < len(self._ordinals) and self._ordinals[position] == ordinal
+
+    def _dates(self, lo: int, hi: int) -> List[datetime.date]:
+        return [datetime.date.fromordinal(o) for o in self._ordinals[lo:hi]]
+
+    def count_in_month(self, year: int, month: int) -> int:
+        """O(1) number of slots in the given month."""
+        lo, hi = self._month_offsets.get((year, month), (0, 0))
+        return hi - lo
+
+    def slots_in_month(self, year: int, month: int) -> List[datetime.date]:
+        """Sorted slots in the given month."""
+        lo, hi = self._month_offsets.get((year, month), (0, 0))
+        return self._dates(lo, hi)
+
+    def count_before(self, day: datetime.date) -> int:
+        """O(log n) number of slots strictly before `day`."""
+        return bisect_left(self._ordinals, day.toordinal())
+
+    def first_before(self, day: datetime.date, limit: int) -> List[datetime.date]:
+        """The earliest `limit` slots strictly before `day`, in order."""
+        return self._dates(0, min(limit, self.count_before(day)))
+
+    def between(self, lo: int, hi: int) -> List[datetime.date]:
+        """Slots whose day-ordinal lies in [lo, hi], in order."""
+        return self._dates(bisect_left(self._ordinals, lo), bisect_right(self._ordinals, hi))
@@ -0,0 +1,249 @@
+import datetime
+import json
+import logging
+import os
+from calendar import monthrange
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Weekday constants
+MONDAY = 0
+WEDNESDAY = 2
+
+# A compiled calendar maps (year, month) to a day mask where bit d-1 means day d is open
+MonthKey = Tuple[int, int]
+Calendar = Dict[MonthKey, int]
+
+
+def month_days(year: int, month: int, mask: int) -> List[datetime.date]:
+    """Decodes one month's day mask into its dates, in order."""
+    days = []
+    while mask:
+        low = mask & -mask
+        days.append(datetime.date(year, month, low.bit_length()))
+        mask ^= low
+    return days
+
+
+def iter_months(start: datetime.date, end: datetime.date) -> List[MonthKey]:
+    """(year, month) for every month from start to end, inclusive."""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class AvailabilityRules:
+    """
+    Declarative availability for one location.
+
+    Slots recur on `weekdays` between `start` and `end`. Only months listed in
+    `exclusions` are open at all; each lists, per weekday, the days of that
+    month that are not offered. Months overlapping an `unavailable` period
+    have those days closed regardless.
+    """
+
+    def __init__(
+        self,
+        start: datetime.date,
+        end: datetime.date,
+        weekdays: Iterable[int],
+        exclusions: Dict[MonthKey, Dict[int, Set[int]]],
+        unavailable: Iterable[Tuple[datetime.date, datetime.date]] = (),
+    ):
+        self.start = start
+        self.end = end
+        self.weekdays = tuple(sorted(set(weekdays)))
+        self.exclusions = exclusions
+        self.unavailable = tuple(unavailable)
+
+    def months(self) -> List[MonthKey]:
+        return iter_months(self.start, self.end)
+
+    def month_fingerprint(self, year: int, month: int) -> Tuple:
+        """Everything that decides one month's calendar; equal fingerprints compile identically."""
+        first = datetime.date(year, month, 1)
+        last = datetime.date(year, month, monthrange(year, month)[1])
+        excluded = self.exclusions.get((year, month))
+        return (
+            year, month,
+            max(self.start, first), min(self.end, last),
+            self.weekdays,
+            None if excluded is None else tuple(sorted(
+                (weekday, tuple(sorted(days))) for weekday, days in excluded.items()
+            )),
+            tuple(sorted(period for period in self.unavailable
+                         if period[0] <= last and period[1] >= first)),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AvailabilityRules':
+        """
+        Builds rules from their JSON form:
+        {"start": "2025-12-01", "end": "2026-12-31", "weekdays": [0, 2],
+         "unavailable": [["2025-12-01", "2026-05-31"]],
+         "months": {"2026-06": {"0": [24], "2": [24]}, ...}}
+        """
+        parse = datetime.date.fromisoformat
+        exclusions = {}
+        for key, days_by_weekday in data.get('months', {}).items():
+            year, month = (int(part) for part in key.split('-'))
+            exclusions[(year, month)] = {int(weekday): set(days) for weekday, days in days_by_weekday.items()}
+        return cls(
+            start=parse(data['start']),
+            end=parse(data['end']),
+            weekdays=data['weekdays'],
+            exclusions=exclusions,
+            unavailable=[(parse(lo), parse(hi)) for lo, hi in data.get('unavailable', [])],
+        )
+
+
+def compile_month(fingerprint: Tuple) -> int:
+    """
+    Compiles one month into its day mask. Stepping by weeks from each weekday's
+    first occurrence touches only candidate days, never the whole calendar.
+    """
+    year, month, first, last, weekdays, excluded, unavailable = fingerprint
+    if excluded is None or first > last:
+        return 0
+    excluded = dict(excluded)
+    first_weekday = datetime.date(year, month, 1).weekday()
+
+    mask = 0
+    for weekday in weekdays:
+        skip = set(excluded.get(weekday, ()))
+        for day in range((weekday - first_weekday) % 7 + 1, last.day + 1, 7):
+            if day >= first.day and day not in skip:
+                mask |= 1 << (day - 1)
+
+    for lo, hi in unavailable:
+        lo_day = 1 if (lo.year, lo.month) < (year, month) else lo.day
+        hi_day = last.day if (hi.year, hi.month) > (year, month) else hi.day
+        mask &= ~(((1 << (hi_day - lo_day + 1)) - 1) << (lo_day - 1))
+    return mask
+
+
+class ScheduleCache:
+    """
+    Compiled month masks keyed by month fingerprint, shared by every source of
+    a listener. Locations (or rule revisions) with identical rules for a month
+    compile it once. Oldest entries are evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._masks: 'OrderedDict[Tuple, int]' = OrderedDict()
+        self.compiled = 0
+
+    def month(self, fingerprint: Tuple) -> int:
+        mask = self._masks.get(fingerprint)
+        if mask is None:
+            mask = self._masks[fingerprint] = compile_month(fingerprint)
+            self.compiled += 1
+            if len(self._masks) > self.max_entries:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(fingerprint)
+        return mask
+
+
+class SlotSource:
+    """
+    Where one location's open slots come from. fetch() returns the current
+    compiled calendar; it is a coroutine so sources that scrape or call an API
+    can run concurrently with the other locations.
+    """
+
+    location: str
+
+    async def fetch(self) -> Calendar:
+        raise NotImplementedError
+
+
+class RuleSlotSource(SlotSource):
+    """
+    Slots compiled from AvailabilityRules. After set_rules() only the months
+    whose fingerprint changed are recompiled; the rest are reused as-is.
+    """
+
+    def __init__(self, location: str, rules: AvailabilityRules, cache: Optional[ScheduleCache] = None):
+        self.location = location
+        self.cache = cache or ScheduleCache()
+        self.rules = rules
+        self._fingerprints: Dict[MonthKey, Tuple] = {}
+        self._calendar: Calendar = {}
+
+    def set_rules(self, rules: AvailabilityRules):
+        self.rules = rules
+
+    def compile(self) -> Calendar:
+        fingerprints = {key: self.rules.month_fingerprint(*key) for key in self.rules.months()}
+        if fingerprints == self._fingerprints:
+            return self._calendar
+
+        changed = [key for key, fingerprint in fingerprints.items()
+                   if self._fingerprints.get(key) != fingerprint]
+        calendar = {key: self._calendar[key] for key in fingerprints if key not in changed}
+        for key in changed:
+            calendar[key] = self.cache.month(fingerprints[key])
+        if self._fingerprints:
+            logging.info(f"Availability rules for {self.location} changed: "
+                         f"recompiled {len(changed)} of {len(fingerprints)} month(s).")
+
+        self._fingerprints = fingerprints
+        self._calendar = calendar
+        return calendar
+
+    async def fetch(self) -> Calendar:
+        return self.compile()
+
+
+class RuleFileSlotSource(RuleSlotSource):
+    """RuleSlotSource that re-reads its location's entry in a JSON rules file when the file changes."""
+
+    def __init__(self, location: str, path: str, cache: Optional[ScheduleCache] = None):
+        self.path = path
+        self._mtime = os.stat(path).st_mtime
+        super().__init__(location, _read_rules(path)[location], cache)
+
+    async def fetch(self) -> Calendar:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.set_rules(_read_rules(self.path)[self.location])
+        except Exception as e:
+            logging.error(f"Failed to reload availability rules for {self.location}, keeping the previous ones: {e}")
+        return self.compile()
+
+
+def _read_rules(path: str) -> Dict[str, AvailabilityRules]:
+    with open(path) as f:
+        return {location: AvailabilityRules.from_dict(data) for location, data in json.load(f).items()}
+
+
+def sources_from_file(path: str, cache: Optional[ScheduleCache] = None) -> List[SlotSource]:
+    """One reloading source per location in a {location: rules} JSON file, sharing one cache."""
+    cache = cache or ScheduleCache()
+    return [RuleFileSlotSource(location, path, cache) for location in _read_rules(path)]
+
+
+# The original Accra schedule: Mondays and Wednesdays from June 2026, minus per-month exclusions
+DEFAULT_LOCATION = "Accra U.S. Embassy/Consulate"
+DEFAULT_RULES = AvailabilityRules(
+    start=datetime.date(2025, 12, 1),
+    end=datetime.date(2026, 12, 31),
+    weekdays=(MONDAY, WEDNESDAY),
+    exclusions={
+        (2026, 6): {MONDAY: {24}, WEDNESDAY: {24}},
+        (2026, 7): {MONDAY: set(), WEDNESDAY: set()},
+        (2026, 8): {MONDAY: {26}, WEDNESDAY: {26}},
+        (2026, 9): {MONDAY: {*range(1, 31)} - {7, 28}, WEDNESDAY: {23}},
+        (2026, 10): {MONDAY: {12}, WEDNESDAY: {28}},
+        (2026, 11): {MONDAY: set(), WEDNESDAY: {11, 25}},
+        (2026, 12): {MONDAY: {28}, WEDNESDAY: {23, 30}},
+    },
+    unavailable=[(datetime.date(2025, 12, 1), datetime.date(2026, 5, 31))],
+)
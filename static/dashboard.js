@@ -0,0 +1,147 @@
+// Live dashboard: patches the rows on this page from /dashboard/events (Server-Sent Events).
+// Everything from the server is inserted as text, never as markup.
+(function () {
+    'use strict';
+
+    var status = document.getElementById('live-status');
+    if (!status || !window.EventSource) {
+        return;
+    }
+    var notice = document.getElementById('live-notice');
+    var alertList = document.getElementById('live-alerts');
+    var MAX_ALERTS_SHOWN = 10;
+    var otherChanges = 0;
+
+    function row(accountId) {
+        return document.querySelector('tr[data-account-id="' + accountId + '"]');
+    }
+
+    function cell(tr, field) {
+        return tr.querySelector('[data-field="' + field + '"]');
+    }
+
+    function highlight(element) {
+        element.classList.add('table-warning');
+        setTimeout(function () { element.classList.remove('table-warning'); }, 2000);
+    }
+
+    function label(text) {
+        var strong = document.createElement('strong');
+        strong.textContent = text;
+        return strong;
+    }
+
+    function showNotice(text) {
+        notice.textContent = text;
+        notice.classList.remove('d-none');
+    }
+
+    // Mirrors the cells rendered by dashboard.html
+    function renderAccount(tr, account) {
+        cell(tr, 'unique_id').textContent = account.unique_id;
+        cell(tr, 'name').textContent = account.first_name + ' ' + account.last_name;
+
+        var target = cell(tr, 'target');
+        target.textContent = '';
+        target.append(label('From:'), ' ' + account.target_month_year + '-' + account.target_day_start);
+        if (account.target_day_end) {
+            target.append(document.createElement('br'), label('To Day:'), ' ' + account.target_day_end);
+        }
+
+        var type = cell(tr, 'appointment_type');
+        type.textContent = '';
+        if (account.appointment_type === 'new' || account.appointment_type === 'reschedule') {
+            var badge = document.createElement('span');
+            badge.className = account.appointment_type === 'new' ? 'badge bg-primary' : 'badge bg-warning text-dark';
+            badge.textContent = account.appointment_type === 'new' ? 'New Appointment' : 'Reschedule';
+            type.append(badge);
+        }
+
+        if (account.last_checked) {
+            cell(tr, 'last_checked').textContent = account.last_checked;
+        }
+        highlight(tr);
+    }
+
+    function addAlert(alert) {
+        var item = document.createElement('li');
+        item.className = 'list-group-item small';
+        item.style.whiteSpace = 'pre-line';
+        item.append(label(alert.created_at + ' '), alert.text);
+        alertList.prepend(item);
+        while (alertList.children.length > MAX_ALERTS_SHOWN) {
+            alertList.lastElementChild.remove();
+        }
+    }
+
+    function showCycle(cycle) {
+        var summary = cycle.summary;
+        status.textContent = 'Live · last listener cycle ' + cycle.finished_at + ' (' + cycle.worker_id + '): ' +
+            (summary.checked || 0) + ' checked, ' + (summary.matched || 0) + ' with earlier slots, ' +
+            (summary.queued || 0) + ' message(s) queued, ' + (summary.accounts || 0) + ' account(s) in memory.';
+    }
+
+    function applyChanges(changes) {
+        (changes.accounts || []).forEach(function (account) {
+            var tr = row(account.id);
+            if (tr) {
+                renderAccount(tr, account);
+            }
+        });
+        (changes.removed || []).forEach(function (accountId) {
+            var tr = row(accountId);
+            if (tr) {
+                tr.classList.add('text-muted', 'text-decoration-line-through');
+            }
+        });
+        Object.keys(changes.checked || {}).forEach(function (accountId) {
+            var tr = row(accountId);
+            if (tr) {
+                var checked = cell(tr, 'last_checked');
+                if (checked.textContent.trim() !== changes.checked[accountId]) {
+                    checked.textContent = changes.checked[accountId];
+                    highlight(checked);
+                }
+            }
+        });
+        if (changes.other) {
+            otherChanges += changes.other;
+            showNotice(otherChanges + ' account change(s) outside this page. Reload to see them.');
+        }
+        var alerts = changes.alerts || [];
+        // Account alerts have no preview here: their details only go to Telegram
+        if (changes.alert_count > alerts.length) {
+            addAlert({created_at: '', text: (changes.alert_count - alerts.length) + ' account alert(s), sent to Telegram.'});
+        }
+        alerts.slice().reverse().forEach(addAlert);
+        (changes.cycles || []).forEach(showCycle);
+    }
+
+    // The event id is a cursor any web worker can resume from. Streams are closed after a while
+    // (or at once when the server is busy) and EventSource reconnects by itself, so only an
+    // outage that lasts is reported.
+    var source = new EventSource(status.dataset.eventsUrl);
+    var connected = false;
+    var outageTimer = null;
+
+    source.addEventListener('changes', function (event) {
+        if (outageTimer) {
+            clearTimeout(outageTimer);
+            outageTimer = null;
+        }
+        if (!connected) {
+            connected = true;
+            status.textContent = 'Live updates on';
+        }
+        applyChanges(JSON.parse(event.data));
+    });
+
+    source.addEventListener('error', function () {
+        if (!outageTimer) {
+            outageTimer = setTimeout(function () {
+                connected = false;
+                status.textContent = 'Live updates reconnecting…';
+            }, 15000);
+        }
+    });
+})();
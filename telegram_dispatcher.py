@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from metrics import REGISTRY
+
+# Telegram Bot API limits: ~30 messages/s overall, ~1 message/s per private
+# chat and ~20 messages/min per group (group chat ids are negative).
+GLOBAL_RATE_PER_SECOND = 30.0
+CHAT_RATE_PER_SECOND = 1.0
+GROUP_RATE_PER_SECOND = 20.0 / 60.0
+
+SEND_SECONDS = REGISTRY.histogram('telegram_send_seconds', 'Latency of one sendMessage call, any outcome.')
+THROTTLE_SECONDS = REGISTRY.histogram('telegram_throttle_seconds', 'Time spent waiting for rate-limit tokens.')
+MESSAGES_SENT = REGISTRY.counter('telegram_messages_sent_total', 'Messages delivered.')
+MESSAGES_DROPPED = REGISTRY.counter('telegram_messages_dropped_total', 'Messages given up on.')
+SEND_RETRIES = REGISTRY.counter('telegram_send_retries_total', 'Failed send attempts that were retried.', ['reason'])
+
+
+class TokenBucket:
+    """Token bucket that hands out send times instead of blocking."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long the caller must wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Empties the bucket so nothing is handed out for `seconds` (flood control)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class TelegramDispatcher:
+    """
+    Delivers Telegram messages with bounded concurrency.
+
+    At most `max_concurrency` sends are in flight at once. Every send first
+    waits for its chat's bucket without holding a slot, so a busy chat does not
+    hold up the others, then takes a slot and a token from the global bucket.
+    RetryAfter pauses the chat for the time Telegram asks for; network errors
+    are retried with exponential backoff. Any other error fails the delivery
+    with a log line.
+    """
+
+    def __init__(
+        self,
+        bot,
+        max_concurrency: int = 8,
+        global_rate: float = GLOBAL_RATE_PER_SECOND,
+        chat_rate: float = CHAT_RATE_PER_SECOND,
+        group_rate: float = GROUP_RATE_PER_SECOND,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+    ):
+        self.bot = bot
+        self.max_concurrency = max_concurrency
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        # First network-error retry delay; doubles on every further attempt
+        self.backoff_seconds = backoff_seconds
+
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+        self.slots = asyncio.Semaphore(max_concurrency)
+
+        self.sent = 0
+        self.dropped = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, 1)
+        return bucket
+
+    async def deliver(self, chat_id: int, text: str, parse_mode: str = 'HTML') -> bool:
+        """Sends one message, waiting for its chat's rate budget and a free slot. Returns success."""
+        backoff = self.backoff_seconds
+        for attempt in range(1, self.max_retries + 1):
+            await _wait(self._chat_bucket(chat_id))
+            try:
+                async with self.slots:
+                    # Taken only once the chat may send, so a throttled chat never holds global budget
+                    await _wait(self.global_bucket)
+                    with SEND_SECONDS.time():
+                        await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                self.sent += 1
+                MESSAGES_SENT.inc()
+                return True
+            except RetryAfter as e:
+                SEND_RETRIES.labels('flood_control').inc()
+                retry_after = _seconds(e.retry_after)
+                logging.warning(f"Telegram flood control for chat {chat_id}: retrying in {retry_after}s",
+                                extra={'sample': 'telegram_flood_control'})
+                self._chat_bucket(chat_id).pause(retry_after)
+            except BadRequest as e:
+                # Subclass of NetworkError, but resending the same request cannot help
+                logging.error(f"Failed to send Telegram message: {e}")
+                break
+            except (TimedOut, NetworkError) as e:
+                SEND_RETRIES.labels('network').inc()
+                logging.warning(f"Telegram send attempt {attempt} failed: {e}. Retrying in {backoff}s",
+                                extra={'sample': 'telegram_network_error'})
+                await asyncio.sleep(backoff)
+                backoff *= 2
+            except Exception as e:
+                logging.error(f"Failed to send Telegram message: {e}")
+                break
+
+        self.dropped += 1
+        MESSAGES_DROPPED.inc()
+        logging.error(f"Giving up on Telegram message for chat {chat_id} after {attempt} attempt(s).")
+        return False
+
+
+async def _wait(bucket: TokenBucket):
+    delay = bucket.reserve()
+    if delay > 0:
+        THROTTLE_SECONDS.observe(delay)
+        await asyncio.sleep(delay)
+
+
+def _seconds(retry_after) -> float:
+    # PTB 21 reports an int; later releases may hand back a timedelta
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
@@ -0,0 +1,40 @@
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_index import OPEN_START, AccountWindowIndex, account_window  # noqa: E402
+
+
+def _day(day: int) -> int:
+    return datetime.date(2026, 2, day).toordinal()
+
+
+def test_window_without_end_day_is_everything_before_start():
+    assert account_window('2026-02', 10) == (OPEN_START, _day(9))
+
+
+def test_window_with_end_day_starts_at_start_day():
+    assert account_window('2026-02', 10, 20) == (_day(10), _day(20))
+    # Clamped to the month, and an end before the start is ignored
+    assert account_window('2026-02', 10, 31) == (_day(10), _day(28))
+    assert account_window('2026-02', 10, 5) == (OPEN_START, _day(9))
+
+
+def test_stab_matches_brute_force():
+    rng = random.Random(7)
+    index = AccountWindowIndex()
+    windows = {}
+    for key in range(300):
+        start = rng.randint(1, 28)
+        end = rng.choice([None, rng.randint(start, 28)])
+        windows[key] = account_window('2026-02', start, end)
+        index.add(key, *windows[key])
+    index.discard(0)
+    del windows[0]
+
+    for day in range(1, 29):
+        expected = {key for key, (lo, hi) in windows.items() if lo <= _day(day) <= hi}
+        assert set(index.stab(_day(day))) == expected
@@ -0,0 +1,20 @@
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_io import parse_rows  # noqa: E402
+
+
+def test_csv_rows_are_read_by_header():
+    body = b'\xef\xbb\xbfunique_id,email\r\nU1,a@example.com\r\n'
+    assert parse_rows(body, 'text/csv; charset=utf-8') == [{'unique_id': 'U1', 'email': 'a@example.com'}]
+
+
+def test_oversized_csv_field_is_a_value_error():
+    oversized = 'x' * (csv.field_size_limit() + 1)
+    with pytest.raises(ValueError, match='Malformed CSV'):
+        parse_rows(f'unique_id,email\nU1,{oversized}\n'.encode(), 'text/csv')
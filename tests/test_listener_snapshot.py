@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_feed import AccountRecord  # noqa: E402
+from listener_snapshot import ListenerSnapshot  # noqa: E402
+
+FIELDS = ('id', 'unique_id', 'email', 'first_name', 'last_name', 'target_month_year',
+          'target_day_start', 'target_day_end', 'telegram_chat_id')
+
+
+def _snapshot() -> ListenerSnapshot:
+    accounts = [
+        AccountRecord(1, 'U1', 'a@example.com', 'Ann', 'Lee', '2026-09', 10, 20, None),
+        # Form input may contain NUL (%00) and any other character
+        AccountRecord(2, 'U\x002', 'b\x00@example.com', 'Zoë', '\x00', '2026-10', 1, None, -1001234),
+        AccountRecord(3, 'U3', 'c@example.com', '', 'Ó Briain', '2026-11', 5, 5, 42),
+    ]
+    return ListenerSnapshot(
+        created_at=1767225600.5, base_ordinal=739221, watermark='2026-01-01T00:00:00', database='sqlite:///x.db',
+        calendars={'Accra': {(2026, 9): 0b1010, (2026, 10): 0}, 'Lagos\x00B': {(2026, 9): 1}},
+        accounts=accounts, windows={1: (100, 200), 3: (5, 5)}, due={1: 12.5, 2: 0.25}, misses={1: 3},
+        retired={3}, notified={'account:1': 0b101, 'location:Lagos\x00B': 1 << 400, 'account:2': 0},
+    )
+
+
+def test_round_trip(tmp_path):
+    original = _snapshot()
+    path = str(tmp_path / 'listener.snap')
+    original.dump(path)
+    loaded = ListenerSnapshot.load(path)
+
+    assert [[getattr(a, field) for field in FIELDS] for a in loaded.accounts] == \
+        [[getattr(a, field) for field in FIELDS] for a in original.accounts]
+    for name in ('created_at', 'base_ordinal', 'watermark', 'database', 'calendars', 'windows', 'due',
+                 'misses', 'retired', 'notified'):
+        assert getattr(loaded, name) == getattr(original, name), name
+
+
+def test_empty_round_trip(tmp_path):
+    path = str(tmp_path / 'listener.snap')
+    ListenerSnapshot(0.0, 1, None, 'db', {}, [], {}, {}, {}, set(), {}).dump(path)
+    loaded = ListenerSnapshot.load(path)
+    assert loaded.accounts == [] and loaded.notified == {} and loaded.watermark is None
+
+
+def test_corrupt_file_is_rejected(tmp_path):
+    path = str(tmp_path / 'listener.snap')
+    _snapshot().dump(path)
+    with open(path, 'r+b') as f:
+        f.seek(-3, os.SEEK_END)
+        f.write(b'\xff')
+    with pytest.raises(ValueError):
+        ListenerSnapshot.load(path)
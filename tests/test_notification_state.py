@@ -0,0 +1,48 @@
+import datetime
+import os
+import sys
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Base, NotificationState  # noqa: E402
+from notification_state import NotifiedSlots, account_key  # noqa: E402
+
+BASE = datetime.date(2025, 12, 1).toordinal()
+
+
+def _stored(engine):
+    with Session(engine) as session:
+        return {row.key: row.bitmap for row in session.scalars(select(NotificationState))}
+
+
+def test_write_replaces_rows_it_never_loaded():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    # Written by another worker (shard handover), or left unread by a failed load()
+    earlier = NotifiedSlots(BASE)
+    earlier.update(account_key(1), 0b1)
+    earlier.update(account_key(2), 0b10)
+    with Session(engine) as session:
+        earlier.write(session)
+        session.commit()
+    earlier.mark_clean()
+
+    unaware = NotifiedSlots(BASE)
+    unaware.update(account_key(1), 0b110)
+    unaware.update(account_key(3), 0b1)
+    with Session(engine) as session:
+        unaware.write(session)
+        session.commit()
+    unaware.mark_clean()
+    assert _stored(engine) == {account_key(1): b'\x06', account_key(2): b'\x02', account_key(3): b'\x01'}
+
+    # Forgetting a key this object never loaded still deletes its row
+    unaware.update(account_key(2), 0b1)
+    unaware.forget([account_key(2)])
+    with Session(engine) as session:
+        unaware.write(session)
+        session.commit()
+    assert account_key(2) not in _stored(engine)
@@ -0,0 +1,45 @@
+import asyncio
+import datetime
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slot_index import from_bitmap, month_mask, to_bitmap  # noqa: E402
+from slot_sources import MONDAY, AvailabilityRules, RuleSlotSource  # noqa: E402
+from visa_listener import VisaSlotListener  # noqa: E402
+
+OCTOBER_RULES = AvailabilityRules(
+    start=datetime.date(2025, 10, 6),
+    end=datetime.date(2025, 12, 31),
+    weekdays=(MONDAY,),
+    exclusions={(2025, 10): {}, (2025, 11): {}, (2025, 12): {}},
+)
+
+
+def test_days_before_base_are_left_out():
+    base = datetime.date(2025, 12, 1).toordinal()
+    slots = [datetime.date(2025, 11, 24), datetime.date(2025, 12, 1), datetime.date(2025, 12, 8)]
+    assert from_bitmap(to_bitmap(slots, base), base) == slots[1:]
+    assert month_mask(2025, 11, base) == 0
+    assert month_mask(2025, 10, datetime.date(2025, 10, 15).toordinal()) == (1 << 17) - 1
+
+
+def test_base_follows_rules_starting_before_december(caplog):
+    listener = VisaSlotListener(1, sources=[RuleSlotSource('Early', OCTOBER_RULES)])
+    assert listener.start_date == datetime.date(2025, 10, 1)
+    assert listener.notified.base_ordinal == datetime.date(2025, 10, 1).toordinal()
+
+    async def sweep():
+        schedule = listener.locations[0]
+        await schedule.refresh()
+        await listener._check_location(schedule)
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(sweep())
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    # One alert per month with slots, October included
+    texts = [row['text'] for row in listener.pending_notifications]
+    assert len(texts) == 3
+    assert any('October 2025' in text for text in texts)
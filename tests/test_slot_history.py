@@ -0,0 +1,120 @@
+import datetime
+import os
+import random
+import sys
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import slot_history  # noqa: E402
+from models import Base, SlotHistory  # noqa: E402
+from slot_history import EPOCH_ORDINAL, HistoryWriter, _decode, _encode, _replay, availability  # noqa: E402
+
+LOCATION = 'Lagos'
+START = datetime.datetime(2026, 3, 1, 12, 0)
+DAY = datetime.date(2026, 4, 1)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def _days(*offsets):
+    return {DAY + datetime.timedelta(days=offset) for offset in offsets}
+
+
+def _bits(slots):
+    return sum(1 << (slot.toordinal() - EPOCH_ORDINAL) for slot in slots)
+
+
+def _at(minutes):
+    return START + datetime.timedelta(minutes=minutes)
+
+
+def test_decode_rebases_and_drops_days_before_base():
+    bits = _bits(_days(0, 3, 40))
+    row_base, (data,) = _encode([bits], EPOCH_ORDINAL)
+    assert row_base == DAY.toordinal()
+    assert _decode(data, row_base, EPOCH_ORDINAL) == bits
+    # Onto a later base: day 0 is before it and dropped, the rest shift down
+    assert _decode(data, row_base, DAY.toordinal() + 3) == 0b1 | 1 << 37
+    assert _decode(_encode([0], EPOCH_ORDINAL)[1][0], EPOCH_ORDINAL, EPOCH_ORDINAL) == 0
+
+
+def test_record_writes_changes_only_and_replays_across_snapshots(session):
+    rng = random.Random(21)
+    writer = HistoryWriter()
+    schedules = []
+    for minute in range(slot_history.SNAPSHOT_EVERY + 8):
+        slots = {DAY + datetime.timedelta(days=rng.randrange(60)) for _ in range(10)}
+        assert writer.record(session, LOCATION, slots, _at(minute))
+        # The same schedule again is not a change
+        assert not writer.record(session, LOCATION, slots, _at(minute))
+        schedules.append(slots)
+    session.commit()
+
+    rows = session.scalars(select(SlotHistory).order_by(SlotHistory.id)).all()
+    assert len(rows) == len(schedules)
+    assert [index for index, row in enumerate(rows) if row.snapshot is not None] == [0, slot_history.SNAPSHOT_EVERY]
+    for minute, slots in enumerate(schedules):
+        _, bits, _ = _replay(session, LOCATION, EPOCH_ORDINAL, until=_at(minute))
+        assert bits == _bits(slots)
+    head, _, since_snapshot = _replay(session, LOCATION, EPOCH_ORDINAL)
+    assert (head, since_snapshot) == (rows[-1].id, 7)
+
+    # A writer that did not write those rows replays them before appending its own
+    other = HistoryWriter()
+    assert not other.record(session, LOCATION, schedules[-1], _at(100))
+    assert other.record(session, LOCATION, schedules[-1] - {min(schedules[-1])}, _at(100))
+    row = session.scalars(select(SlotHistory).order_by(SlotHistory.id.desc()).limit(1)).one()
+    assert _decode(row.removed, row.base_ordinal, EPOCH_ORDINAL) == _bits({min(schedules[-1])})
+    assert _decode(row.added, row.base_ordinal, EPOCH_ORDINAL) == 0
+
+
+def test_replay_skips_rows_stamped_with_the_snapshot_but_written_before_it(session, monkeypatch):
+    monkeypatch.setattr(slot_history, 'SNAPSHOT_EVERY', 3)
+    writer = HistoryWriter()
+    for slots in (_days(0), _days(0, 1), _days(1), _days(1, 2), _days(2)):
+        # All in the same instant: only the id orders them
+        writer.record(session, LOCATION, slots, _at(0))
+    session.commit()
+
+    snapshots = session.scalars(select(SlotHistory.id).where(SlotHistory.snapshot.is_not(None))).all()
+    assert len(snapshots) == 2
+    head, bits, since_snapshot = _replay(session, LOCATION, EPOCH_ORDINAL, until=_at(0))
+    assert bits == _bits(_days(2))
+    assert since_snapshot == 1
+    assert head == max(session.scalars(select(SlotHistory.id)))
+
+
+def test_availability_intervals_across_a_snapshot_boundary(session, monkeypatch):
+    monkeypatch.setattr(slot_history, 'SNAPSHOT_EVERY', 3)
+    writer = HistoryWriter()
+    for minute, slots in enumerate((_days(0), _days(0, 1), _days(1), _days(1, 2), _days(2), _days(0, 2))):
+        writer.record(session, LOCATION, slots, _at(minute * 10))
+    session.commit()
+
+    # Starts after the first snapshot, ends after the second (written at minute 30)
+    result = availability(session, LOCATION, _at(15), _at(45), DAY, DAY + datetime.timedelta(days=2))
+    open_intervals = {slot['date']: slot['open'] for slot in result['slots']}
+
+    def iso(minutes):
+        return _at(minutes).isoformat() + 'Z'
+
+    assert open_intervals == {
+        DAY.isoformat(): [[None, iso(20)]],
+        (DAY + datetime.timedelta(days=1)).isoformat(): [[None, iso(40)]],
+        (DAY + datetime.timedelta(days=2)).isoformat(): [[iso(30), None]],
+    }
+    assert result['changes'] == 3
+    assert result['open_at_until'] == 1
+    # A row stamped at `since` is part of the starting state; days outside first_day..last_day are left out
+    narrow = availability(session, LOCATION, _at(0), _at(60), DAY, DAY)
+    assert narrow['slots'] == [{'date': DAY.isoformat(), 'open': [[None, iso(20)], [iso(50), None]]}]
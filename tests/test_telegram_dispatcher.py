@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram_dispatcher import TelegramDispatcher  # noqa: E402
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode):
+        self.sent.append((chat_id, time.monotonic()))
+
+
+def test_throttled_chat_does_not_hold_slots_or_global_budget():
+    async def run():
+        bot = RecordingBot()
+        # One slot, a global budget of 3 and a chat that may send every 0.2s
+        dispatcher = TelegramDispatcher(bot, max_concurrency=1, global_rate=3.0, chat_rate=5.0)
+        started = time.monotonic()
+        busy = [asyncio.create_task(dispatcher.deliver(1, 'busy')) for _ in range(4)]
+        await asyncio.sleep(0)
+        others = await asyncio.gather(*(dispatcher.deliver(chat_id, 'other') for chat_id in (2, 3)))
+        others_done = time.monotonic() - started
+        assert all(others) and all(await asyncio.gather(*busy))
+        return others_done
+
+    # The queued sends to chat 1 wait on its bucket alone, so chats 2 and 3 go out at once
+    assert asyncio.run(run()) < 0.1
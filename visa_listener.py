@@ -1,287 +1,817 @@
 import datetime
+import html
+import json
 import time
 import asyncio
-from typing import List, Optional, Dict, Set
-import telegram
+from typing import List, Optional, Dict, Set, FrozenSet, Tuple
 import os
 import logging
+from collections import Counter
 from dotenv import load_dotenv
-from calendar import monthrange 
+from logging_config import setup_logging
+from slot_index import SlotIndex, from_bitmap, month_mask, to_bitmap
+from notification_digest import CycleDigest, account_section, location_preview, location_section
+from slot_history import HistoryWriter
+from listener_snapshot import ListenerSnapshot
+from notification_state import LEGACY_GLOBAL_KEY, NotifiedSlots, account_key, key_account_id, location_key
+from shard_lease import ShardLeaseManager, default_worker_id
+from account_feed import WATERMARK_OVERLAP, AccountChangeFeed, AccountRecord, PgChangeListener
+from account_index import AccountWindowIndex, account_window
+from check_scheduler import CheckScheduler
+from metrics import REGISTRY, serve_metrics
+from slot_sources import (
+    DEFAULT_LOCATION, DEFAULT_RULES, Calendar, RuleSlotSource, ScheduleCache, SlotSource, month_days
+)
 
 # Load environment variables
 load_dotenv()
 
 # --- Logging Configuration ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Queued and written by a background thread; per-account lines are sampled and
+# each cycle ends with one summary record (LOG_FORMAT=json for structured output)
+setup_logging()
 
 # --- CRITICAL IMPORTS FOR DATABASE ACCESS (FIXED) ---
-from app import app
-from models import db, VisaAccount 
+# Plain SQLAlchemy sessions: the listener never imports the Flask app. Every
+# query runs on the database threads (run_db) so the event loop never blocks on it.
+from database import get_engine, run_db, session_scope
+from models import VisaAccount, NotificationOutbox, NotificationState, ListenerCycle, ACCOUNT_CHANGES_CHANNEL
+from sqlalchemy import delete, func, insert, select, update
 # --- END CRITICAL IMPORTS ---
 
-# Weekday constants
-MONDAY = 0
-WEDNESDAY = 2
-
 # CRITICAL FIX: The entire outdated context block is removed.
 
+# --- Metrics (served on metrics_port, see metrics.py) ---
+CYCLE_SECONDS = REGISTRY.histogram('listener_cycle_seconds', 'Busy time of one listener loop iteration.')
+SWEEP_SECONDS = REGISTRY.histogram('listener_month_sweep_seconds', 'Duration of the location refresh and month sweep.')
+DB_SECONDS = REGISTRY.histogram('listener_db_seconds', 'Time spent in database work.', ['operation'])
+DB_ERRORS = REGISTRY.counter('listener_db_errors_total', 'Failed database operations.', ['operation'])
+ACCOUNTS_CHECKED = REGISTRY.counter('listener_accounts_checked_total', 'Account checks run.')
+ACCOUNTS_RETIRED = REGISTRY.counter('listener_accounts_retired_total', 'Accounts retired after their deadline passed.')
+NOTIFICATIONS_QUEUED = REGISTRY.counter('listener_notifications_queued_total', 'Messages written to the outbox.')
+ACCOUNTS = REGISTRY.gauge('listener_accounts', 'Accounts held in memory.')
+ACCOUNTS_SCHEDULED = REGISTRY.gauge('listener_accounts_scheduled', 'Accounts waiting on the check scheduler.')
+
+# Shortest sleep between scheduler ticks, so due checks are batched rather than run one by one
+MIN_TICK_SECONDS = 1.0
+# Cycle summaries are published to the dashboard (listener_cycle) at most this often
+CYCLE_STATUS_SECONDS = 10.0
+# Summaries of workers silent for this long are deleted
+CYCLE_STATUS_RETENTION = datetime.timedelta(days=1)
+# Warm-restart snapshot (see listener_snapshot.py) is rewritten at most this often
+SNAPSHOT_SECONDS = 300.0
+
+
+class LocationSchedule:
+    """One monitored location: its slot source and the schedule last fetched from it."""
+
+    def __init__(self, source: SlotSource):
+        self.source = source
+        self.location = source.location
+        self.calendar: Calendar = {}
+        self.full_schedule: Set[datetime.date] = set()
+        self.slot_index = SlotIndex(())
+        # False until the first successful fetch, so a failing source never reads as "no slots"
+        self.loaded = False
+        # Bumped on every schedule change
+        self.version = 0
+        # Slots added or removed by the last change
+        self.changed: Set[datetime.date] = set()
+
+    async def refresh(self) -> bool:
+        """Fetches the calendar; rebuilds the schedule only if it changed. Returns whether it did."""
+        calendar = await self.source.fetch()
+        self.loaded = True
+        if calendar == self.calendar:
+            return False
+        self.restore(calendar)
+        return True
+
+    def restore(self, calendar: Calendar):
+        """Builds the schedule from a calendar; used directly for one saved in a snapshot."""
+        self.calendar = dict(calendar)
+        previous = self.full_schedule
+        self.full_schedule = {day for (year, month), mask in calendar.items()
+                              for day in month_days(year, month, mask)}
+        self.changed = self.full_schedule ^ previous
+        self.slot_index = SlotIndex(self.full_schedule)
+        self.version += 1
+
 class VisaSlotListener:
     """
     Combines:
-    1. Global Month-by-Month Slot Checker (Sends constant alerts for all months).
-    2. Account-Specific Monitoring (Checks against full_schedule).
+    1. Global Month-by-Month Slot Checker (Sends constant alerts for all months),
+       for every location in `sources`, refreshed concurrently every
+       `month_sweep_seconds`.
+    2. Account-Specific Monitoring (Checks against the first location's full_schedule).
+       Accounts are checked when due on a CheckScheduler: immediately when their
+       window or the schedule changes, then more often the closer their deadline.
+       Accounts whose deadline has passed are retired.
+
+    With `shard_count` set, several listener processes split the accounts
+    between them through shard leases; the owner of shard 0 also runs the
+    global month check. A worker handles nothing until its first heartbeat
+    succeeds, nor once renewals have failed for longer than the lease time.
+
+    Alerts are only written to the notification outbox; the sender process
+    (run_sender.py) delivers them to Telegram. An alert is only raised when the
+    slots differ from what was last notified, which is persisted across restarts.
+    Account alerts also go to the account's own telegram_chat_id when set. With
+    `digest`, each cycle's alerts are sent as one message per chat (split at
+    Telegram's length limit) instead of one per changed month and account.
+
+    With `snapshot_path` (single-process mode), the in-memory state is saved
+    there periodically and a restart resumes from it instead of rebuilding.
     """
     
     def __init__(
         self,
-        telegram_token: str,
         telegram_chat_id: int,
         # TIMING CHANGE: Changed default cycle poll interval to 15 seconds
         poll_interval_seconds: int = 15, 
-        location: str = "Accra U.S. Embassy/Consulate"
+        location: str = DEFAULT_LOCATION,
+        shard_count: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        sources: Optional[List[SlotSource]] = None,
+        month_sweep_seconds: Optional[float] = None,
+        metrics_port: Optional[int] = None,
+        digest: bool = False,
+        snapshot_path: Optional[str] = None
     ):
-        self.telegram_token = telegram_token
         self.telegram_chat_id = telegram_chat_id
         self.poll_interval = poll_interval_seconds
-        self.location = location
-
-        self.start_date = datetime.date(2025, 12, 1)
-        self.end_date = datetime.date(2026, 12, 31)
+        self.month_sweep_interval = month_sweep_seconds or poll_interval_seconds
+        # Port for the /metrics endpoint; None leaves it off
+        self.metrics_port = metrics_port
+        # Loop timing: next feed poll and month sweep (monotonic), shortest sleep between cycles
+        self.next_poll = self.next_sweep = 0.0
+        self.min_tick = MIN_TICK_SECONDS
 
         # --- GLOBAL SLOT CHECKER SETUP ---
-        self.full_schedule: Set[datetime.date] = self._calculate_full_schedule()
-        self.previous_slots: Set[datetime.date] = set() 
-        self.month_iterator = self._get_month_range()
-        
-        # Setup Telegram bot
-        self.bot = telegram.Bot(token=telegram_token)
-        
-        # NOTE: New attribute for inner Telegram delays
-        self.telegram_delay_seconds = 5 
-
-    def _get_availability_rules(self) -> Dict[int, Dict[int, Set[int]]]:
-        """Defines the deterministic availability rules for 2026."""
-        return {
-            6: {MONDAY: {24}, WEDNESDAY: {24}},
-            7: {MONDAY: set(), WEDNESDAY: set()},
-            8: {MONDAY: {26}, WEDNESDAY: {26}},
-            9: {MONDAY: {*range(1, 31)} - {7, 28}, WEDNESDAY: {23}},
-            10: {MONDAY: {12}, WEDNESDAY: {28}},
-            11: {MONDAY: set(), WEDNESDAY: {11, 25}},
-            12: {MONDAY: {28}, WEDNESDAY: {23, 30}},
-        }
+        # Compiled months are shared between every location's rule source
+        self.schedule_cache = ScheduleCache()
+        if not sources:
+            sources = [RuleSlotSource(location, DEFAULT_RULES, self.schedule_cache)]
+        self.locations = [LocationSchedule(source) for source in sources]
+        # Accounts are matched against the first location
+        self.location = self.locations[0].location
+        # Earliest date any alert bitmap can hold: the first month of the earliest rules
+        # (sources that are not rule-based are assumed to start with the default rules)
+        self.start_date = min(
+            (source.rules.start.replace(day=1) for source in sources if isinstance(source, RuleSlotSource)),
+            default=DEFAULT_RULES.start,
+        )
+        # Last-notified slot bitmaps (per location and per account), loaded at startup
+        self.notified = NotifiedSlots(self.start_date.toordinal())
+        # Schedule changes appended to slot_history, and the schedule version last recorded per location
+        self.history = HistoryWriter()
+        self.history_versions: Dict[str, int] = {}
 
-    def _calculate_full_schedule(self) -> Set[datetime.date]:
-        """Calculates the entire deterministic schedule once."""
-        schedule = set()
-        rules = self._get_availability_rules()
-        current_date = self.start_date
-        
-        while current_date <= self.end_date:
-            year, month, day = current_date.year, current_date.month, current_date.day
-            
-            if (year == 2025 and month == 12) or (year == 2026 and month <= 5):
-                current_date += datetime.timedelta(days=1)
-                continue
+        # --- ACCOUNT MONITOR SETUP ---
+        # Inverted slot -> accounts lookup over every account's target window
+        self.account_index = AccountWindowIndex()
+        # Accounts kept in memory and refreshed only from rows changed since the last poll
+        self.account_feed = AccountChangeFeed()
+        self.change_listener: Optional[PgChangeListener] = None
+        # Next-due heap for account checks; urgent accounts come up every poll interval
+        self.scheduler = CheckScheduler(poll_interval_seconds)
+
+        # --- SHARDING SETUP ---
+        self.worker_id = worker_id or default_worker_id()
+        # None means this listener handles every account (single-process mode)
+        self.leases: Optional[ShardLeaseManager] = None
+        # Sharded mode owns nothing until a heartbeat has acquired leases
+        self.owned_shards: FrozenSet[int] = frozenset()
+        self.leases_renewed_at: Optional[float] = None
+        if shard_count:
+            self.leases = ShardLeaseManager(
+                shard_count,
+                self.worker_id,
+                lease_seconds=max(60, 3 * poll_interval_seconds)
+            )
 
-            if year == 2026 and month in rules:
-                weekday = current_date.weekday()
+        # Outbox rows queued during the current phase, flushed in one insert
+        self.pending_notifications: List[Dict] = []
+        # Digest mode: a cycle's alerts are grouped per chat into as few messages as fit,
+        # instead of one message per changed month and per matched account
+        self.digest: Optional[CycleDigest] = CycleDigest() if digest else None
 
-                if weekday in (MONDAY, WEDNESDAY):
-                    month_rules = rules[month]
-                    
-                    if weekday == MONDAY and day not in month_rules[MONDAY]:
-                        schedule.add(current_date)
-                    
-                    elif weekday == WEDNESDAY and day not in month_rules[WEDNESDAY]:
-                        schedule.add(current_date)
+        # What the current cycle did, logged as one summary record when it ends
+        self.cycle_stats: Counter = Counter()
+        # Latest summary, published for the dashboard every cycle_status_seconds
+        self.last_summary: Optional[Dict] = None
+        self.cycle_status_seconds = CYCLE_STATUS_SECONDS
+        self.cycle_status_written_at = 0.0
 
-            current_date += datetime.timedelta(days=1)
-            
-        return schedule
-
-    def _get_month_range(self) -> List[datetime.date]:
-        """Generates a list of the first day of every month in the target range."""
-        months = []
-        current = self.start_date.replace(day=1)
-        last_month = self.end_date.replace(day=1)
-
-        while current <= last_month:
-            months.append(current)
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                try:
-                    current = current.replace(month=current.month + 1)
-                except ValueError:
-                    days_in_month = monthrange(current.year, current.month + 1)[1]
-                    current = current.replace(month=current.month + 1, day=min(current.day, days_in.month))
-        return months
-
-
-    async def _send_telegram_message(self, message: str):
-        """Sends an HTML formatted message to Telegram."""
+        # Account id -> time it was last checked, written back in bulk at most every
+        # last_checked_flush_seconds so the dashboard shows real freshness
+        self.pending_checks: Dict[int, datetime.datetime] = {}
+        self.last_checked_flush_seconds = 60
+        self.last_checked_flushed_at = 0.0
+
+        # Warm-restart snapshot file (single-process mode only); None disables it
+        self.snapshot_path = snapshot_path
+        self.snapshot_seconds = SNAPSHOT_SECONDS
+        self.snapshot_written_at = time.monotonic()
+
+    async def _send_telegram_message(self, message: str, chat_ids: Optional[List[int]] = None,
+                                     preview: Optional[str] = None):
+        """
+        Queues an HTML formatted message for the outbox; see _flush_notifications.
+        `preview` is what the live dashboard may show of it (never account details).
+        """
+        for chat_id in chat_ids or [self.telegram_chat_id]:
+            self.pending_notifications.append(
+                {'chat_id': chat_id, 'text': message, 'parse_mode': 'HTML', 'preview': preview}
+            )
+
+    def _account_chats(self, account: AccountRecord) -> List[int]:
+        """The operator chat, plus the account's own chat when it has one."""
+        if account.telegram_chat_id and account.telegram_chat_id != self.telegram_chat_id:
+            return [self.telegram_chat_id, account.telegram_chat_id]
+        return [self.telegram_chat_id]
+
+    def _write_notifications(self, rows: List[Dict]):
+        with DB_SECONDS.labels('flush_notifications').time(), session_scope() as session:
+            if rows:
+                session.execute(insert(NotificationOutbox), rows)
+            self.notified.write(session)
+            session.commit()
+
+    async def _flush_notifications(self):
+        """
+        Writes queued messages and the notified-slot changes behind them in one
+        transaction, so an alert is recorded as sent only if it was queued.
+        Both are kept for retry on failure.
+        """
+        if self.digest:
+            self.pending_notifications.extend(
+                {'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML', 'preview': preview}
+                for chat_id, text, preview in self.digest.render()
+            )
+        if not self.pending_notifications and not self.notified.has_changes():
+            return
+        rows = self.pending_notifications
         try:
-            await self.bot.send_message(chat_id=self.telegram_chat_id, text=message, parse_mode='HTML')
+            await run_db(self._write_notifications, rows)
         except Exception as e:
-            logging.error(f"Failed to send Telegram message: {e}")
-
-    async def _check_month_and_report(self, month_start: datetime.date):
-        # ... (implementation remains the same) ...
-        # [No changes needed in this function aside from the calling logic in run_async]
-        
-        year = month_start.year
-        month = month_start.month
-        month_name = month_start.strftime('%B %Y')
-        
-        is_unavailable_period = (year == 2025 and month == 12) or (year == 2026 and month <= 5)
-
-        if is_unavailable_period:
-            month_slots = set() 
+            DB_ERRORS.labels('flush_notifications').inc()
+            logging.critical(f"CRITICAL ERROR: Failed to write notification outbox: {e}")
+            return
+        self.notified.mark_clean()
+        if rows:
+            NOTIFICATIONS_QUEUED.inc(len(rows))
+            self.cycle_stats['queued'] += len(rows)
+            logging.debug(f"Queued {len(rows)} notification(s) in the outbox.")
+        self.pending_notifications = self.pending_notifications[len(rows):]
+
+    def _owns_account(self, account_id: int) -> bool:
+        return self.leases is None or account_id % self.leases.shard_count in self.owned_shards
+
+    def _owns_global(self) -> bool:
+        return self.leases is None or 0 in self.owned_shards
+
+    def _keeps_state(self, key: str) -> bool:
+        account_id = key_account_id(key)
+        return self._owns_global() if account_id is None else self._owns_account(account_id)
+
+    def _heartbeat(self) -> FrozenSet[int]:
+        with DB_SECONDS.labels('lease_heartbeat').time(), session_scope() as session:
+            return self.leases.heartbeat(session)
+
+    async def _refresh_shards(self):
+        """Heartbeats the shard leases; on a change, reloads alert state for the new shard set."""
+        if self.leases is None:
+            return
+        try:
+            owned = await run_db(self._heartbeat)
+        except Exception as e:
+            DB_ERRORS.labels('lease_heartbeat').inc()
+            logging.critical(f"CRITICAL ERROR: Failed to renew shard leases: {e}")
+            # Past the lease time other workers may have taken the shards over: stop working on them
+            if not self.owned_shards or (
+                self.leases_renewed_at is not None
+                and time.monotonic() - self.leases_renewed_at < self.leases.ttl.total_seconds()
+            ):
+                return
+            owned = frozenset()
         else:
-            month_slots = {
-                slot for slot in self.full_schedule 
-                if slot.year == year and slot.month == month
-            }
-        
-        current_slots_in_month = month_slots
-        new_slots_in_month = current_slots_in_month - self.previous_slots 
-
-        if is_unavailable_period:
-            message = f"<b>🔍 Availability Check: {month_name}</b>\n"
-            message += f"<b>Location:</b> {self.location}\n"
-            message += f"<b>Status:</b> No Appointments Available.\n"
-            message += f"<i>Checking again soon...</i>"
-            
-            await self._send_telegram_message(message)
-            logging.info(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Sent Telegram update for {month_name}: No slots.")
+            self.leases_renewed_at = time.monotonic()
 
-        elif new_slots_in_month:
-            self.previous_slots.update(current_slots_in_month)
-            
-            message = f"<b>🎉 NEW VISA SLOTS FOUND! 🎉</b>\n"
-            message += f"<b>Location:</b> {self.location}\n"
-            message += f"<b>Cycle:</b> Constant Alert Mode \n\n"
-            message += f"<b>{month_name}:</b>\n"
-            
-            for slot in sorted(list(new_slots_in_month)):
-                message += f"  ✅ <b>{slot.strftime('%Y-%m-%d')} ({slot.strftime('%A')})</b> ← NEW!\n"
-            
-            message += "\n🚨🚨🚨🚨🚨🚨🚨🚨🚨🚨"
-            
-            await self._send_telegram_message(message)
-            logging.info(f"New slots detected and alert sent for {month_name}!")
-        
+        if owned != self.owned_shards:
+            logging.info(f"Worker {self.leases.worker_id} now owns shard(s) {sorted(owned)} "
+                         f"of {self.leases.shard_count}.")
+            # Persist what we have before dropping state for shards we no longer own
+            await self._flush_notifications()
+            self.owned_shards = owned
+            self.notified = NotifiedSlots(self.notified.base_ordinal)
+            await self._load_notified_state()
+            # Reload accounts for the new shard set from scratch
+            self.account_feed.reset()
+            self.account_index.clear()
+            self.scheduler.clear()
+
+    def _record_checks(self, account_ids, checked_at: datetime.datetime):
+        for account_id in account_ids:
+            self.pending_checks[account_id] = checked_at
+
+    def _write_last_checked(self, by_time: Dict[datetime.datetime, List[int]]):
+        with DB_SECONDS.labels('flush_last_checked').time(), session_scope() as session:
+            for checked_at, account_ids in by_time.items():
+                for i in range(0, len(account_ids), 1000):
+                    session.execute(
+                        update(VisaAccount)
+                        .where(VisaAccount.id.in_(account_ids[i:i + 1000]))
+                        .values(last_checked=checked_at)
+                        .execution_options(synchronize_session=False)
+                    )
+            session.commit()
+
+    async def _flush_last_checked(self, force: bool = False):
+        """
+        Writes pending check times with one UPDATE ... WHERE id IN (...) per distinct
+        timestamp (chunked), instead of one statement or commit per account.
+        updated_at is left alone so these writes do not feed back into the change feed.
+        """
+        if not self.pending_checks:
+            return
+        if not force and time.monotonic() - self.last_checked_flushed_at < self.last_checked_flush_seconds:
+            return
+
+        pending, self.pending_checks = self.pending_checks, {}
+        by_time: Dict[datetime.datetime, List[int]] = {}
+        for account_id, checked_at in pending.items():
+            by_time.setdefault(checked_at, []).append(account_id)
+
+        try:
+            await run_db(self._write_last_checked, by_time)
+        except Exception as e:
+            DB_ERRORS.labels('flush_last_checked').inc()
+            logging.error(f"Failed to write last_checked: {e}")
+            # Keep them for the next flush, behind any newer check of the same account
+            self.pending_checks = {**pending, **self.pending_checks}
+            return
+        self.cycle_stats['last_checked_written'] += len(pending)
+        logging.debug(f"Recorded last_checked for {len(pending)} account(s).")
+        self.last_checked_flushed_at = time.monotonic()
+
+    def _read_notified_state(self):
+        with DB_SECONDS.labels('load_state').time(), session_scope() as session:
+            self.notified.load(session, keep=self._keeps_state)
+
+    async def _load_notified_state(self):
+        try:
+            await run_db(self._read_notified_state)
+        except Exception as e:
+            DB_ERRORS.labels('load_state').inc()
+            logging.critical(f"CRITICAL ERROR: Failed to load notification state: {e}")
+        self._prune_location_state()
+
+    def _prune_location_state(self):
+        if self._owns_global():
+            # The old single-location state belongs to the first location
+            primary = location_key(self.location)
+            if self.notified.get(LEGACY_GLOBAL_KEY) and not self.notified.get(primary):
+                self.notified.update(primary, self.notified.get(LEGACY_GLOBAL_KEY))
+            # Drop state of locations no longer monitored
+            current = {location_key(schedule.location) for schedule in self.locations}
+            self.notified.forget(key for key in self.notified.keys()
+                                 if key_account_id(key) is None and key not in current)
+
+    async def _refresh_locations(self) -> bool:
+        """
+        Fetches every location's slots concurrently; a failing source keeps its
+        last schedule. Returns whether the first location's schedule changed.
+        """
+        results = await asyncio.gather(
+            *(schedule.refresh() for schedule in self.locations), return_exceptions=True
+        )
+        for schedule, result in zip(self.locations, results):
+            if isinstance(result, Exception):
+                logging.error(f"Failed to fetch slots for {schedule.location}: {result}")
+            elif result:
+                logging.info(f"Schedule for {schedule.location} updated: {len(schedule.full_schedule)} slot(s).")
+        return results[0] is True
+
+    @property
+    def full_schedule(self) -> Set[datetime.date]:
+        return self.locations[0].full_schedule
+
+    async def _check_location(self, schedule: LocationSchedule):
+        for year, month in sorted(schedule.calendar):
+            try:
+                await self._check_month_and_report(schedule, year, month)
+            except Exception as e:
+                logging.error(f"Error during month check for {schedule.location}: {e}")
+
+    def _write_history(self, schedules: List[LocationSchedule]) -> int:
+        with DB_SECONDS.labels('history').time(), session_scope() as session:
+            written = sum(self.history.record(session, schedule.location, schedule.full_schedule)
+                          for schedule in schedules)
+            session.commit()
+        return written
+
+    async def _record_history(self):
+        """Appends the schedules that changed since they were last recorded to slot_history."""
+        changed = [schedule for schedule in self.locations
+                   if schedule.loaded and schedule.version != self.history_versions.get(schedule.location)]
+        if not changed:
+            return
+        try:
+            written = await run_db(self._write_history, changed)
+        except Exception as e:
+            DB_ERRORS.labels('history').inc()
+            logging.error(f"Failed to record slot history: {e}")
+            return
+        for schedule in changed:
+            self.history_versions[schedule.location] = schedule.version
+        self.cycle_stats['history_rows'] += written
+
+    async def _check_month_and_report(self, schedule: LocationSchedule, year: int, month: int):
+        month_name = datetime.date(year, month, 1).strftime('%B %Y')
+        base = self.notified.base_ordinal
+
+        # Unavailable months compile to an empty mask, so they need no special case
+        month_slots = schedule.slot_index.slots_in_month(year, month)
+
+        added, removed = self.notified.update(
+            location_key(schedule.location), to_bitmap(month_slots, base), month_mask(year, month, base)
+        )
+
+        if not added and not removed:
+            logging.debug(f"Checking {month_name} ({schedule.location}): no change since last alert.")
+            return
+
+        added_slots, removed_slots = from_bitmap(added, base), from_bitmap(removed, base)
+        preview = location_preview(month_name, added_slots, removed_slots, schedule.location)
+        if self.digest is not None:
+            self.digest.add([self.telegram_chat_id],
+                            location_section(month_name, added_slots, removed_slots, schedule.location), bool(added),
+                            preview)
         else:
-            self.previous_slots.update(current_slots_in_month)
-            logging.info(f"Checking {month_name}, slots previously found in this cycle.")
+            message = ''.join((
+                "<b>🎉 NEW VISA SLOTS FOUND! 🎉</b>\n" if added else "<b>⚠️ Visa Slots No Longer Available</b>\n",
+                f"<b>Location:</b> {html.escape(schedule.location)}\n",
+                "<b>Cycle:</b> Change Alert Mode \n\n",
+                location_section(month_name, added_slots, removed_slots),
+                "\n🚨🚨🚨🚨🚨🚨🚨🚨🚨🚨" if added else "",
+            ))
+            await self._send_telegram_message(message, preview=preview)
+        self.cycle_stats['location_alerts'] += 1
+        logging.info(f"Slot changes detected and alert queued for {month_name} ({schedule.location})!")
+
+
+    def _apply_account_changes(self, changed: List[AccountRecord], removed: List[int]):
+        """Updates the account window index from the change feed and makes changed accounts due."""
+        now = time.monotonic()
+        for account in changed:
+            try:
+                lo, hi = account_window(
+                    account.target_month_year, account.target_day_start, account.target_day_end
+                )
+            except Exception as e:
+                logging.error(f"[DATA ERROR] Failed to parse date range for account {account.unique_id}: {e}",
+                              extra={'sample': 'account_data_error'})
+                self.account_index.discard(account.id)
+                self.scheduler.discard(account.id)
+                continue
+            if self.account_index.window(account.id) != (lo, hi):
+                # New account or new target window: check it now
+                self.account_index.add(account.id, lo, hi)
+                self.scheduler.touch(account.id, now)
+                self.cycle_stats['accounts_updated'] += 1
+
+        for account_id in removed:
+            self.account_index.discard(account_id)
+            self.scheduler.discard(account_id)
+        self.cycle_stats['accounts_removed'] += len(removed)
 
+        # Deleted accounts (including ones removed while the feed was reset) get no further alerts
+        self.notified.forget(account_key(account_id) for account_id in self.notified.account_ids()
+                             if account_id not in self.account_feed.accounts)
 
-    async def _check_account(self, account: VisaAccount):
-        # ... (implementation remains the same) ...
-        # [No changes needed in this function aside from the calling logic in run_async]
-        
+    def _read_account_changes(self, criteria) -> Tuple[List[AccountRecord], List[int]]:
+        with DB_SECONDS.labels('poll_accounts').time(), session_scope() as session:
+            return self.account_feed.poll(session, *criteria)
+
+    async def _poll_account_changes(self) -> bool:
+        """Pulls changed accounts into memory. Returns False if the database could not be read."""
+        criteria = []
+        if self.leases is not None:
+            if not self.owned_shards:
+                # No leases (yet): this worker handles no accounts
+                return True
+            criteria.append((VisaAccount.id % self.leases.shard_count).in_(self.owned_shards))
         try:
-            month_year_str = account.target_month_year
-            year, month = map(int, month_year_str.split('-'))
-            reference_date = datetime.date(year, month, account.target_day_start)
-            target_range_str = f"Before {reference_date.strftime('%Y-%m-%d')}"
+            changed, removed = await run_db(self._read_account_changes, criteria)
         except Exception as e:
-            logging.error(f"[DATA ERROR] Failed to parse date range for account {account.unique_id}: {e}")
-            return  
+            DB_ERRORS.labels('poll_accounts').inc()
+            logging.critical(f"CRITICAL ERROR: Failed to query database: {e}")
+            return False
+
+        self._apply_account_changes(changed, removed)
+        return True
+
+    def _touch_affected(self, slots: Set[datetime.date], now: float):
+        """Makes due every scheduled account whose target window contains one of the slots."""
+        affected = self.account_index.match(slots).keys() - self.scheduler.retired
+        for account_id in affected:
+            self.scheduler.touch(account_id, now)
+        self.cycle_stats['accounts_affected'] += len(affected)
+
+    def _match_accounts(self, account_ids: List[int]) -> Dict[int, List[datetime.date]]:
+        """Matching slots for the given accounts, in date order."""
+        slot_index = self.locations[0].slot_index
+        matches = {}
+        for account_id in account_ids:
+            lo, hi = self.account_index.window(account_id)
+            slots = slot_index.between(lo, hi)
+            if slots:
+                matches[account_id] = slots
+        return matches
+
+    async def _check_due_accounts(self):
+        """Checks the accounts whose turn has come and schedules their next check."""
+        if not self.locations[0].loaded:
+            logging.warning(f"No schedule for {self.location} yet; skipping account checks.",
+                            extra={'sample': 'no_schedule'})
+            return
+        now = time.monotonic()
+        due = [account_id for account_id in self.scheduler.pop_due(now) if account_id in self.account_index]
+        if not due:
+            return
+
+        matches = self._match_accounts(due)
+        today = datetime.date.today().toordinal()
+        self._record_checks(due, datetime.datetime.utcnow())
+
+        checked = matched = 0
+        for account_id in due:
+            account = self.account_feed.accounts[account_id]
+            _, hi = self.account_index.window(account_id)
+            if not self.scheduler.reschedule(account_id, now, hi - today, account_id in matches):
+                # Deadline passed: nothing earlier can still be booked, so stop alerting
+                self.notified.forget([account_key(account_id)])
+                continue
+            checked += 1
+            matched += account_id in matches
+            try:
+                await self._check_account(account, matches.get(account_id, []))
+            except Exception as e:
+                logging.error(f"Error checking account {account.unique_id}: {e}", extra={'sample': 'account_error'})
+
+        ACCOUNTS_CHECKED.inc(checked)
+        ACCOUNTS_RETIRED.inc(len(due) - checked)
+        self.cycle_stats.update(checked=checked, matched=matched, retired=len(due) - checked)
+
+    async def _check_account(self, account: AccountRecord, slots: List[datetime.date]):
+        """Alerts one account if its matching slots (in date order) changed since its last alert."""
+        base = self.notified.base_ordinal
+        added, removed = self.notified.update(account_key(account.id), to_bitmap(slots, base))
+        if not added and not removed:
+            return
+
+        lo, hi = account_window(account.target_month_year, account.target_day_start, account.target_day_end)
+        deadline = datetime.date.fromordinal(hi)
+        if account.target_day_end and account.target_day_end >= account.target_day_start:
+            target_range_str = (f"{datetime.date.fromordinal(lo).strftime('%Y-%m-%d')} "
+                                f"to {deadline.strftime('%Y-%m-%d')}")
+        else:
+            target_range_str = f"Before {(deadline + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}"
 
         name = f"{account.first_name} {account.last_name}".strip()
-        uid = account.unique_id
-        
-        earlier_slots_found = {
-            slot for slot in self.full_schedule 
-            if slot < reference_date
-        }
+        section = account_section(name, account.unique_id, account.email, target_range_str,
+                                  from_bitmap(added, base), from_bitmap(removed, base), slots)
+        if self.digest is not None:
+            self.digest.add(self._account_chats(account), section, bool(added))
+        else:
+            header = "<b>🚨 EARLIER SLOT FOUND! 🚨</b>\n" if added else "<b>⚠️ Earlier Slots No Longer Available</b>\n"
+            await self._send_telegram_message(header + section, self._account_chats(account))
+        self.cycle_stats['account_alerts'] += 1
+        logging.info(f"Slot change alert queued for {name}.", extra={'sample': 'account_alert'})
 
-        if earlier_slots_found: 
-            message = (
-                f"<b>🚨 EARLIER SLOT FOUND! 🚨</b>\n"
-                f"<b>Name:</b> {name}\n"
-                f"<b>ID:</b> <code>{uid}</code>\n"
-                f"<b>Target:</b> {target_range_str}\n\n"
-                f"<b>Found Slots:</b>\n"
-            )
-            for slot in sorted(list(earlier_slots_found))[:5]:
-                message += f"  ✅ <b>{slot.strftime('%Y-%m-%d')} ({slot.strftime('%A')})</b>\n"
-            
-            message += f"\n<b>ACTION REQUIRED:</b> Log in with email <code>{account.email}</code> to reschedule!"
-            
-            await self._send_telegram_message(message)
-            logging.info(f"EARLIER SLOT FOUND for {name}!")
 
+    async def start(self):
+        """One-time setup before the first cycle: change notifications, metrics endpoint, alert state."""
+        logging.info(f"Starting combined listener (Async) → Polling every {self.poll_interval}s")
+        logging.info(f"Locations: {', '.join(schedule.location for schedule in self.locations)}")
+        logging.warning("--- Alerts are sent only when slots change since the last alert. Account logic is FIXED to check for EARLIER slots. ---")
+
+        self.change_listener = PgChangeListener(get_engine(), ACCOUNT_CHANGES_CHANNEL)
+        if self.change_listener.start():
+            logging.info(f"Listening for account changes on channel {ACCOUNT_CHANGES_CHANNEL}")
+        if self.metrics_port:
+            await serve_metrics(self.metrics_port)
+
+        if self.leases is None:
+            if not await self._restore_snapshot():
+                await self._load_notified_state()
         else:
-            logging.info(f"No earlier slot yet for {name} (Searching: {target_range_str})")
+            logging.info(f"Sharded mode: {self.leases.shard_count} shard(s), worker {self.leases.worker_id}")
+
+        self.next_poll = self.next_sweep = time.monotonic()
 
+    def _database_name(self) -> str:
+        return get_engine().url.render_as_string(hide_password=True)
+
+    def _read_snapshot(self) -> Tuple[ListenerSnapshot, AccountChangeFeed, NotifiedSlots, List[AccountRecord], List[int]]:
+        """
+        Maps the snapshot, brings its accounts and alert state up to date from
+        rows changed since it was written, and checks both against the row
+        counts in the database. Raises ValueError if it cannot be used.
+        """
+        snapshot = ListenerSnapshot.load(self.snapshot_path)
+        if snapshot.database != self._database_name():
+            raise ValueError('written for another database')
+        if snapshot.base_ordinal != self.notified.base_ordinal:
+            raise ValueError('written with another alert bitmap base')
+
+        feed = AccountChangeFeed()
+        feed.accounts = {account.id: account for account in snapshot.accounts}
+        feed.watermark = datetime.datetime.fromisoformat(snapshot.watermark) if snapshot.watermark else None
+        notified = NotifiedSlots(snapshot.base_ordinal)
+        notified.restore(snapshot.notified)
+        written_at = datetime.datetime.utcfromtimestamp(snapshot.created_at)
+
+        with DB_SECONDS.labels('restore_snapshot').time(), session_scope() as session:
+            changed, removed = feed.poll(session)
+            notified.load(session, since=written_at - WATERMARK_OVERLAP)
+            live_accounts, alert_rows = session.execute(select(
+                select(func.count()).select_from(VisaAccount).where(VisaAccount.deleted_at.is_(None))
+                .scalar_subquery(),
+                select(func.count()).select_from(NotificationState).scalar_subquery(),
+            )).one()
+        if live_accounts != len(feed.accounts):
+            raise ValueError(f'{len(feed.accounts)} account(s) after catching up, {live_accounts} in the database')
+        # Alert rows deleted since the snapshot cannot be caught up on
+        if alert_rows != len(notified.keys()):
+            raise ValueError(f'{len(notified.keys())} alert state(s) after catching up, {alert_rows} in the database')
+        return snapshot, feed, notified, changed, removed
+
+    async def _restore_snapshot(self) -> bool:
+        """
+        Warm start: adopts the schedule, accounts, check schedule and alert
+        state saved in the snapshot, so the first cycle only checks accounts
+        that are due. Returns False (state untouched) if there is no usable snapshot.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            snapshot, feed, notified, changed, removed = await run_db(self._read_snapshot)
+        except Exception as e:
+            logging.warning(f"Listener snapshot not used ({e}); rebuilding state from the database.")
+            return False
+
+        self.account_feed = feed
+        self.notified = notified
+        for account_id, (lo, hi) in snapshot.windows.items():
+            self.account_index.add(account_id, lo, hi)
+        # Time spent down counts against every account's next check
+        elapsed = max(0.0, time.time() - snapshot.created_at)
+        self.scheduler.restore({account_id: max(0.0, seconds - elapsed) for account_id, seconds in snapshot.due.items()},
+                               snapshot.misses, snapshot.retired, time.monotonic())
+        for schedule in self.locations:
+            if schedule.location in snapshot.calendars:
+                schedule.restore(snapshot.calendars[schedule.location])
+        self._apply_account_changes(changed, removed)
+        self._prune_location_state()
+        logging.info(f"Restored {len(feed.accounts)} account(s) and {len(notified.keys())} alert state(s) "
+                     f"from a snapshot written {elapsed:.0f}s ago ({len(changed) + len(removed)} changed since).")
+        return True
+
+    async def _save_snapshot(self):
+        """Rewrites the snapshot every snapshot_seconds, whenever the alert state matches the database."""
+        now = time.monotonic()
+        if (not self.snapshot_path or self.leases is not None or now - self.snapshot_written_at < self.snapshot_seconds
+                or self.pending_notifications or self.notified.has_changes()):
+            return
+        due, misses = self.scheduler.export(now)
+        watermark = self.account_feed.watermark
+        snapshot = ListenerSnapshot(
+            time.time(), self.notified.base_ordinal, watermark.isoformat() if watermark else None,
+            self._database_name(),
+            {schedule.location: schedule.calendar for schedule in self.locations if schedule.loaded},
+            list(self.account_feed.accounts.values()),
+            {account_id: self.account_index.window(account_id) for account_id in self.account_index.keys()},
+            due, misses, self.scheduler.retired, self.notified.bitmaps(),
+        )
+        self.snapshot_written_at = now
+        try:
+            # Encoded and written off the event loop; nothing above is mutated until this returns
+            await asyncio.to_thread(snapshot.dump, self.snapshot_path)
+        except Exception as e:
+            logging.error(f"Failed to write listener snapshot: {e}")
+
+    def _log_cycle_summary(self, seconds: float, polled: bool, swept: bool):
+        """One record per cycle that did any work, in place of a line per phase, month and account."""
+        stats = self.cycle_stats
+        self.last_summary = {
+            'seconds': round(seconds, 4), 'polled': polled, 'swept': swept,
+            'accounts': len(self.account_feed.accounts), 'scheduled': len(self.scheduler),
+            'retired_total': len(self.scheduler.retired), **stats,
+        }
+        logging.info(
+            f"Cycle done in {seconds:.3f}s: {stats['checked']} account(s) checked, {stats['matched']} with "
+            f"earlier slots, {stats['retired']} retired; {stats['account_alerts'] + stats['location_alerts']} "
+            f"alert(s), {stats['queued']} message(s) queued; {len(self.scheduler)} scheduled.",
+            extra={'event': 'cycle_summary', **self.last_summary},
+        )
+
+    def _write_cycle_status(self, summary: Dict):
+        now = datetime.datetime.utcnow()
+        with DB_SECONDS.labels('cycle_status').time(), session_scope() as session:
+            session.merge(ListenerCycle(worker_id=self.worker_id, finished_at=now, summary=json.dumps(summary)))
+            session.execute(delete(ListenerCycle).where(ListenerCycle.finished_at < now - CYCLE_STATUS_RETENTION))
+            session.commit()
+
+    async def _publish_cycle_status(self):
+        """Stores the latest cycle summary for the dashboard's live feed, at most every cycle_status_seconds."""
+        if self.last_summary is None or time.monotonic() - self.cycle_status_written_at < self.cycle_status_seconds:
+            return
+        summary, self.last_summary = self.last_summary, None
+        try:
+            await run_db(self._write_cycle_status, summary)
+        except Exception as e:
+            DB_ERRORS.labels('cycle_status').inc()
+            logging.error(f"Failed to publish cycle summary: {e}", extra={'sample': 'cycle_status_error'})
+            return
+        self.cycle_status_written_at = time.monotonic()
+
+    async def _sync_accounts(self):
+        await self._refresh_shards()
+        await self._poll_account_changes()
+
+    async def run_cycle(self) -> float:
+        """Runs whatever is due now. Returns the monotonic time the next work is due."""
+        now = time.monotonic()
+        poll_due, sweep_due = now >= self.next_poll, now >= self.next_sweep
+
+        # 1. LEASES AND ACCOUNT CHANGES (every poll interval, or at once on NOTIFY),
+        #    read on the database threads while the locations' slots are fetched (2.)
+        _, schedule_changed = await asyncio.gather(
+            self._sync_accounts() if poll_due else asyncio.sleep(0),
+            self._refresh_locations() if sweep_due else asyncio.sleep(0, False),
+        )
+        if poll_due:
+            self.next_poll = now + self.poll_interval
+
+        # 2. GLOBAL CHECK (own cadence); a changed schedule makes due the accounts whose
+        #    window holds a slot that appeared or went away
+        if sweep_due:
+            if schedule_changed:
+                self._touch_affected(self.locations[0].changed, now)
+            if self._owns_global():
+                logging.debug("--- Running Global Slot Checker (Change Alert Mode) ---")
+                await asyncio.gather(*(self._check_location(schedule) for schedule in self.locations
+                                       if schedule.loaded))
+                if self.digest is None:
+                    await self._flush_notifications()
+                await self._record_history()
+            SWEEP_SECONDS.observe(time.monotonic() - now)
+            self.next_sweep = now + self.month_sweep_interval
+
+        # 3. ACCOUNT CHECK (accounts that are due, most overdue first)
+        await self._check_due_accounts()
+
+        await self._flush_notifications()
+        await self._flush_last_checked()
+
+        seconds = time.monotonic() - now
+        CYCLE_SECONDS.observe(seconds)
+        ACCOUNTS.set(len(self.account_feed.accounts))
+        ACCOUNTS_SCHEDULED.set(len(self.scheduler))
+        if poll_due or sweep_due or self.cycle_stats:
+            self._log_cycle_summary(seconds, polled=poll_due, swept=sweep_due)
+        self.cycle_stats = Counter()
+        await self._publish_cycle_status()
+        await self._save_snapshot()
+
+        return min(self.next_poll, self.next_sweep, self.scheduler.next_due() or self.next_poll)
 
     async def run_async(self):
         """
         Main asynchronous loop that runs BOTH the month spammer and the account checker.
         """
-        logging.info(f"Starting combined listener (Async) → Polling every {self.poll_interval}s")
-        logging.info(f"Location: {self.location}")
-        logging.warning("--- WARNING: Global alerts sent for EVERY month. Account logic is FIXED to check for EARLIER slots. ---")
-        
+        await self.start()
         while True:
-            logging.info("\n--- STARTING NEW FULL CYCLE CHECK (COMBINED) ---")
-            
-            # 1. GLOBAL CHECK
-            self.previous_slots.clear()
-            logging.info("--- Running Global Slot Checker (Constant Alert Mode) ---")
-            for month_start in self.month_iterator:
-                try:
-                    await self._check_month_and_report(month_start)
-                    # TIMING CHANGE: 5-second break between month checks/updates
-                    await asyncio.sleep(self.telegram_delay_seconds) 
-                except Exception as e:
-                    logging.error(f"Error during month check: {e}")
-            
-            # 2. ACCOUNT CHECK (Using app_context to safely query DB)
-            logging.info("--- Running Account Monitor (Earlier Slot Checker) ---")
-            with app.app_context():
-                try:
-                    db.session.remove()
-                    accounts = VisaAccount.query.all()
-                    
-                    if not accounts:
-                        logging.info("No accounts in database.")
-                    else:
-                        logging.info(f"Checking {len(accounts)} account(s)...")
-                        for account in accounts:
-                            try:
-                                await self._check_account(account)
-                                # TIMING CHANGE: 5-second break between account checks/updates
-                                await asyncio.sleep(self.telegram_delay_seconds) 
-                            except Exception as e:
-                                logging.error(f"Error checking account {account.unique_id}: {e}")
-                    
-                    db.session.remove()
-                except Exception as e:
-                    logging.critical(f"CRITICAL ERROR: Failed to query database: {e}")
-
-            logging.info(f"--- Full Cycle Complete. Sleeping {self.poll_interval} seconds. ---")
-            # TIMING CHANGE: 15-second break before the next cycle starts
-            await asyncio.sleep(self.poll_interval)
+            wake = await self.run_cycle()
+            # Sleep until the next thing is due (cut short by NOTIFY on Postgres)
+            if await self.change_listener.wait(max(self.min_tick, wake - time.monotonic())):
+                self.next_poll = 0
             
 # ==================== HOW TO USE ====================
 if __name__ == "__main__":
-    TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
     TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
     
-    if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
-        logging.error("ERROR: TELEGRAM_TOKEN or TELEGRAM_CHAT_ID not set in environment.")
+    if not TELEGRAM_CHAT_ID:
+        logging.error("ERROR: TELEGRAM_CHAT_ID not set in environment.")
         exit(1)
 
     listener = VisaSlotListener(
-        telegram_token=TELEGRAM_TOKEN,
         telegram_chat_id=int(TELEGRAM_CHAT_ID),
         # TIMING CHANGE: Main loop poll interval set to 15 seconds
         poll_interval_seconds=15, 
-        location="Accra U.S. Embassy/Consulate" 
+        location=DEFAULT_LOCATION 
     )
     
     try: